@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "foodgram_api.instrumentation.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -39,16 +40,37 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "foodgram_api.profiling.ProfilingMiddleware",
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'foodgram_api.authentication.CachedTokenAuthentication',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 100
+    'DEFAULT_PAGINATION_CLASS':
+        'foodgram_api.pagination.LimitPageNumberPagination',
+    'PAGE_SIZE': 100,
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.getenv('LOGIN_THROTTLE_IP_RATE', '30/min'),
+        'login_email': os.getenv('LOGIN_THROTTLE_EMAIL_RATE', '5/min'),
+    },
+    # Число прокси перед приложением. 0 — адрес клиента берётся из
+    # REMOTE_ADDR; за nginx (infra/docker-compose.yml) задаётся 1, и адрес
+    # читается из X-Forwarded-For, который ставит nginx
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
+# Алиас кэша для счётчиков троттлинга входа. locmem считает попытки
+# в каждом процессе отдельно; общий бэкенд считает их на весь сервис.
+LOGIN_THROTTLE_CACHE = os.getenv('LOGIN_THROTTLE_CACHE', 'default')
+
+# Кэш токен → пользователь для CachedTokenAuthentication. Включается
+# AUTH_TOKEN_SHARED_CACHE и только с общим бэкендом CACHE_BACKEND
+# (memcached, redis): отзыв токена проверяется по версии в этом кэше.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 60))
+AUTH_TOKEN_SHARED_CACHE = bool(int(os.getenv('AUTH_TOKEN_SHARED_CACHE', 0)))
+
 ROOT_URLCONF = "backend.urls"
 
 TEMPLATES = [
@@ -83,6 +105,33 @@ DATABASES = {
     }
 }
 
+# Версии справочников (теги, ингредиенты) хранятся в базе, кэш держит
+# их CATALOG_VERSION_TTL секунд. С общим бэкендом (memcached, redis)
+# смену версии все воркеры видят сразу, с LocMemCache — не позже TTL.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND',
+                             'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+CATALOG_VERSION_TTL = int(os.getenv('CATALOG_VERSION_TTL', 5))
+
+# Замеры каждого запроса: заголовок Server-Timing (db, view, render,
+# total) и лог запросов дольше SLOW_REQUEST_THRESHOLD миллисекунд.
+REQUEST_TIMING = bool(int(os.getenv('REQUEST_TIMING', 1)))
+SERVER_TIMING_HEADER = bool(int(os.getenv('SERVER_TIMING_HEADER', 1)))
+SLOW_REQUEST_THRESHOLD = int(os.getenv('SLOW_REQUEST_THRESHOLD', 500))
+SLOW_REQUEST_TOP_QUERIES = 3
+
+# Сотрудник может профилировать отдельный запрос под cProfile:
+# заголовок X-Profile: 1 или ?profile=1. Профили смотрит manage.py profiles.
+# Выключено по умолчанию; в PROFILE_DIR хранятся последние
+# PROFILE_MAX_FILES профилей, старые удаляются.
+REQUEST_PROFILING = bool(int(os.getenv('REQUEST_PROFILING', 0)))
+PROFILE_DIR = os.getenv('PROFILE_DIR', BASE_DIR / 'profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 100))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 AUTH_USER_MODEL = 'foodgram_api.User'
@@ -120,6 +169,28 @@ STATIC_ROOT = "static"
 MEDIA_ROOT = "media"
 
 MEDIA_URL = "media/"
+
+# Картинки хранятся под хэшем содержимого в MEDIA_ROOT/images/,
+# nginx отдаёт их с Cache-Control: immutable.
+# Файлы без ссылок удаляет manage.py collect_media.
+DEFAULT_FILE_STORAGE = 'foodgram_api.storage.ContentAddressedStorage'
+
+# Миниатюры и WebP-варианты картинок рецептов строятся в фоновом потоке
+# после ответа на запрос; 0 — обработка сразу после коммита.
+IMAGE_PROCESSING_ASYNC = bool(int(os.getenv('IMAGE_PROCESSING_ASYNC', 1)))
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+# Карточка рецепта во фронтенде — 240px в высоту, берём с запасом под HiDPI
+RECIPE_THUMBNAIL_SIZE = (760, 480)
+RECIPE_IMAGE_QUALITY = 80
+
+INGREDIENT_SEARCH_INDEX = bool(int(os.getenv('INGREDIENT_SEARCH_INDEX', 1)))
+INGREDIENT_SEARCH_LIMIT = 20
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
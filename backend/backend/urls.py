@@ -6,7 +6,8 @@ from foodgram_api.views import UserViewset, TokenCreateAPIView, \
     TokenDestroyAPIView, CurrentUserRetrieveAPIView, PasswordChangeAPIView, \
     TagViewset, IngredientViewset, RecipeViewset, SubscriptionListAPIView, \
     SubscriptionCreateDestroyAPIView, FavoritesCreateDestroyAPIView, \
-    ShoppingCartCreateDestroyAPIView, ShoppingCartDownloadAPIView
+    ShoppingCartCreateDestroyAPIView, ShoppingCartDownloadAPIView, \
+    ThrottleStatsAPIView
 
 router = DefaultRouter()
 router.register('users', UserViewset)
@@ -17,6 +18,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/auth/token/login/", TokenCreateAPIView.as_view()),
     path("api/auth/token/logout/", TokenDestroyAPIView.as_view()),
+    path("api/auth/throttle_stats/", ThrottleStatsAPIView.as_view()),
     path("api/users/me/", CurrentUserRetrieveAPIView.as_view()),
     path("api/users/set_password/", PasswordChangeAPIView.as_view()),
     path("api/users/subscriptions/", SubscriptionListAPIView.as_view()),
@@ -1,10 +1,75 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin
 
+from .images import schedule_image_processing
 from .models import IngredientToRecipe, Recipe, Tag, Subscription, Favorites, \
     User, Ingredient, ShoppingCartItem
 
 
+class PaginatedRelatedFieldListFilter(admin.RelatedFieldListFilter):
+    """Фильтр по связанной модели, выводящий варианты страницами.
+
+    Предлагаются только объекты, которые встречаются в списке; номер
+    страницы передаётся в параметре <поле>_page.
+    """
+    page_size = 20
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        self.page_kwarg = f'{field_path}_page'
+        try:
+            self.page = max(int(params.pop(self.page_kwarg, 1)), 1)
+        except ValueError:
+            self.page = 1
+        super().__init__(field, request, params, model, model_admin,
+                         field_path)
+
+    def field_choices(self, field, request, model_admin):
+        queryset = field.related_model._default_manager.filter(
+            pk__in=model_admin.get_queryset(request).values(
+                f'{self.field_path}__pk')
+        )
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        elif not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        start = (self.page - 1) * self.page_size
+        objects = list(queryset[start:start + self.page_size + 1])
+        self.has_next = len(objects) > self.page_size
+        choices = [(obj.pk, str(obj)) for obj in objects[:self.page_size]]
+        # Выбранный объект показываем, даже если он на другой странице
+        if self.lookup_val and self.lookup_val not in {
+                str(pk) for pk, _ in choices}:
+            choices[:0] = [
+                (obj.pk, str(obj))
+                for obj in queryset.filter(pk=self.lookup_val)
+            ]
+        return choices
+
+    def has_output(self):
+        return super().has_output() or self.page > 1
+
+    def choices(self, changelist):
+        yield from super().choices(changelist)
+        if self.page > 1:
+            yield {
+                'selected': False,
+                'query_string': changelist.get_query_string(
+                    {self.page_kwarg: self.page - 1}),
+                'display': '← предыдущие',
+            }
+        if self.has_next:
+            yield {
+                'selected': False,
+                'query_string': changelist.get_query_string(
+                    {self.page_kwarg: self.page + 1}),
+                'display': 'следующие →',
+            }
+
+
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     search_fields = [
@@ -12,8 +77,58 @@ class IngredientAdmin(admin.ModelAdmin):
     ]
 
 
+class LoadedAutocompleteSelect(AutocompleteSelect):
+    """Автодополнение, которое не запрашивает уже загруженный объект.
+
+    AutocompleteSelect читает подпись выбранного значения отдельным
+    запросом, то есть по запросу на строку инлайна. Если форма положила
+    в selected объект, загруженный через select_related, и значение
+    совпадает с ним, подпись берётся из него.
+    """
+    selected = None
+
+    def optgroups(self, name, value, attr=None):
+        if self.selected is None or [str(item) for item in value] != [
+                str(self.selected.pk)]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(
+            name, self.selected.pk,
+            self.choices.field.label_from_instance(self.selected),
+            True, len(options)
+        ))
+        return [(None, options, 0)]
+
+
+class IngredientToRecipeForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.ingredient_id:
+            widget = self.fields['ingredient'].widget
+            # Админка оборачивает виджет в RelatedFieldWidgetWrapper
+            getattr(widget, 'widget', widget).selected = \
+                self.instance.ingredient
+
+
 class IngredientToRecipeInline(admin.TabularInline):
     model = IngredientToRecipe
+    form = IngredientToRecipeForm
+    # Обычный select выводит весь справочник в каждой строке
+    autocomplete_fields = [
+        'ingredient',
+    ]
+    extra = 1
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'ingredient':
+            kwargs['widget'] = LoadedAutocompleteSelect(
+                db_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 @admin.register(User)
@@ -29,9 +144,15 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = [
         IngredientToRecipeInline,
     ]
+    autocomplete_fields = [
+        'author',
+    ]
     list_filter = [
+        ('author', PaginatedRelatedFieldListFilter),
+        ('tags', PaginatedRelatedFieldListFilter),
+    ]
+    list_select_related = [
         'author',
-        'tags',
     ]
     search_fields = [
         'name',
@@ -42,8 +163,19 @@ class RecipeAdmin(admin.ModelAdmin):
         'favorited',
     ]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_image_processing(obj)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
+
+    @admin.display(description='в избранном', ordering='favorites_count')
     def favorited(self, obj):
-        return Favorites.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
 
 @admin.register(Tag)
@@ -0,0 +1,132 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш процесса с временем жизни записей."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE,
+                       settings.AUTH_TOKEN_CACHE_TTL)
+
+
+def get_cache_key(key):
+    # В общий кэш сам токен не попадает
+    return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_version_key(cache_key):
+    return f'{cache_key}:version'
+
+
+def evict_tokens(keys):
+    """Отзывает закэшированные токены во всех процессах.
+
+    Версия токена в общем кэше меняется сейчас и ещё раз после
+    коммита: записи со старой версией больше не принимаются, в том
+    числе прочитанные параллельным запросом из базы до коммита.
+    """
+    if not settings.AUTH_TOKEN_SHARED_CACHE:
+        return
+    version_keys = [get_version_key(get_cache_key(key)) for key in keys]
+    if not version_keys:
+        return
+
+    def evict():
+        cache.set_many({key: uuid4().hex for key in version_keys},
+                       timeout=None)
+
+    evict()
+    transaction.on_commit(evict)
+
+
+def evict_user_tokens(user):
+    if settings.AUTH_TOKEN_SHARED_CACHE:
+        evict_tokens(Token.objects.filter(user=user).values_list(
+            'key', flat=True))
+
+
+def get_token_version(version_key):
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid4().hex, timeout=None)
+        version = cache.get(version_key)
+    return version
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшем токен → пользователь.
+
+    Кэш включается только с AUTH_TOKEN_SHARED_CACHE, то есть с общим
+    бэкендом CACHE_BACKEND: в нём лежат записи для всех процессов и
+    версия каждого токена. LRU-кэш процесса избавляет от чтения самой
+    записи, но версия сверяется с общим кэшем на каждом запросе,
+    поэтому выход, смена пароля и любое сохранение пользователя
+    (см. signals.py) отзывают токен во всех процессах сразу.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.AUTH_TOKEN_SHARED_CACHE:
+            return super().authenticate_credentials(key)
+        cache_key = get_cache_key(key)
+        # Версия читается до базы: отзыв после этого сменит её,
+        # и прочитанная запись не пройдёт следующую сверку
+        version = get_token_version(get_version_key(cache_key))
+        entry = token_cache.get(cache_key)
+        if entry is None or entry[1] != version:
+            entry = cache.get(cache_key)
+            if entry is None or entry[1] != version:
+                entry = (super().authenticate_credentials(key), version)
+                cache.set(cache_key, entry,
+                          timeout=settings.AUTH_TOKEN_CACHE_TTL)
+            token_cache.set(cache_key, entry)
+        user, token = entry[0]
+        # Запрос получает свою копию: изменения request.user
+        # не должны попасть в кэш
+        user = copy.copy(user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
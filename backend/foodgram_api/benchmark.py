@@ -0,0 +1,242 @@
+import math
+import random
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from .counters import reconcile_counters
+from .instrumentation import QueryRecorder
+from .models import Favorites, Ingredient, IngredientToRecipe, Recipe, \
+    ShoppingCartItem, ShoppingListItem, Subscription, Tag, User
+from .shopping_cart import calculate_shopping_lists
+
+SEED_PREFIX = 'seed-'
+BATCH_SIZE = 1000
+
+
+def seed_dataset(users=100, recipes_per_user=10, ingredients_per_recipe=10,
+                 favorites_per_user=20, cart_per_user=5,
+                 subscriptions_per_user=10, random_seed=0):
+    """Заполняет базу синтетическими пользователями и рецептами.
+
+    Все созданные пользователи получают префикс SEED_PREFIX, их рецепты
+    и связи удаляются вместе с ними. Повторный вызов добавляет данные
+    к уже существующим.
+    """
+    rng = random.Random(random_seed)
+    with transaction.atomic():
+        start = User.objects.filter(
+            username__startswith=SEED_PREFIX).count()
+        User.objects.bulk_create([
+            User(username=f'{SEED_PREFIX}{index}',
+                 email=f'{SEED_PREFIX}{index}@example.com',
+                 first_name='Seed', last_name=str(index))
+            for index in range(start, start + users)
+        ], batch_size=BATCH_SIZE)
+        user_ids = list(User.objects.filter(
+            username__startswith=SEED_PREFIX).values_list('pk', flat=True))
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        if not tag_ids:
+            Tag.objects.bulk_create([
+                Tag(name=slug, color='#E26C2D', slug=slug)
+                for slug in ['breakfast', 'lunch', 'dinner']
+            ])
+            tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        ingredient_ids = list(Ingredient.objects.values_list('pk',
+                                                             flat=True))
+        if len(ingredient_ids) < ingredients_per_recipe:
+            Ingredient.objects.bulk_create([
+                Ingredient(name=f'{SEED_PREFIX}ингредиент {index}',
+                           measurement_unit='г')
+                for index in range(ingredients_per_recipe * 10)
+            ], ignore_conflicts=True)
+            ingredient_ids = list(Ingredient.objects.values_list(
+                'pk', flat=True))
+        new_user_ids = user_ids[start:]
+        existing_recipe_ids = set(Recipe.objects.values_list('pk',
+                                                             flat=True))
+        Recipe.objects.bulk_create([
+            Recipe(author_id=user_id, name=f'Рецепт {user_id}-{index}',
+                   image='seed.png', text='Синтетический рецепт ' * 20,
+                   cooking_time=rng.randint(5, 120))
+            for user_id in new_user_ids for index in range(recipes_per_user)
+        ], batch_size=BATCH_SIZE)
+        recipe_ids = list(Recipe.objects.filter(
+            author_id__in=new_user_ids
+        ).exclude(pk__in=existing_recipe_ids).values_list('pk', flat=True))
+        all_recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        IngredientToRecipe.objects.bulk_create([
+            IngredientToRecipe(recipe_id=recipe_id, ingredient_id=pk,
+                               amount=rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for pk in rng.sample(ingredient_ids, ingredients_per_recipe)
+        ], batch_size=BATCH_SIZE)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=pk)
+            for recipe_id in recipe_ids
+            for pk in rng.sample(tag_ids, rng.randint(1, len(tag_ids)))
+        ], batch_size=BATCH_SIZE)
+        Favorites.objects.bulk_create([
+            Favorites(user_id=user_id, recipe_id=recipe_id)
+            for user_id in new_user_ids
+            for recipe_id in rng.sample(
+                all_recipe_ids, min(favorites_per_user, len(all_recipe_ids)))
+        ], batch_size=BATCH_SIZE)
+        ShoppingCartItem.objects.bulk_create([
+            ShoppingCartItem(user_id=user_id, recipe_id=recipe_id)
+            for user_id in new_user_ids
+            for recipe_id in rng.sample(
+                all_recipe_ids, min(cart_per_user, len(all_recipe_ids)))
+        ], batch_size=BATCH_SIZE)
+        Subscription.objects.bulk_create([
+            Subscription(subscriber_id=user_id, user_id=author_id)
+            for user_id in new_user_ids
+            for author_id in rng.sample(
+                user_ids, min(subscriptions_per_user + 1, len(user_ids)))
+            if author_id != user_id
+        ], batch_size=BATCH_SIZE)
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=amount)
+            for (user_id, ingredient_id), amount
+            in calculate_shopping_lists(new_user_ids).items()
+        ], batch_size=BATCH_SIZE)
+        # bulk_create обходит обновление счётчиков
+        reconcile_counters()
+    return len(new_user_ids), len(recipe_ids)
+
+
+def get_benchmark_endpoints(user):
+    """Запросы ко всем маршрутам API: [(метод, url)].
+
+    Записи идут парами «создать — удалить» над объектами, которых у
+    пользователя ещё нет, поэтому прогон не меняет данные. Вход, выход,
+    смена пароля, запись рецептов и админка не замеряются: они меняют
+    состояние, которое не вернуть тем же запросом.
+    """
+    recipe = Recipe.objects.filter(author=user).order_by('-id').first()
+    tag = Tag.objects.order_by('pk').first()
+    ingredient = Ingredient.objects.order_by('pk').first()
+    endpoints = [
+        ('GET', '/api/users/'),
+        ('GET', f'/api/users/{user.pk}/'),
+        ('GET', '/api/users/me/'),
+        ('GET', '/api/users/subscriptions/?recipes_limit=3'),
+        ('GET', '/api/tags/'),
+        ('GET', '/api/ingredients/'),
+        ('GET', '/api/recipes/'),
+        ('GET', '/api/recipes/?is_favorited=1'),
+        ('GET', '/api/recipes/?is_in_shopping_cart=1'),
+        ('GET', f'/api/recipes/?author={user.pk}'),
+        ('GET', '/api/recipes/download_shopping_cart/'),
+    ]
+    if tag is not None:
+        endpoints.append(('GET', f'/api/tags/{tag.pk}/'))
+    if ingredient is not None:
+        endpoints += [
+            ('GET', f'/api/ingredients/{ingredient.pk}/'),
+            ('GET', '/api/ingredients/?name='
+                    + quote(ingredient.name[:3])),
+        ]
+    if recipe is not None:
+        endpoints.append(('GET', f'/api/recipes/{recipe.pk}/'))
+    recipes = Recipe.objects.exclude(author=user).order_by('pk')
+    toggles = [
+        ('favorite', recipes.exclude(favorites__user=user).first()),
+        ('shopping_cart',
+         recipes.exclude(shoppingcartitem__user=user).first()),
+    ]
+    for action, other in toggles:
+        if other is not None:
+            url = f'/api/recipes/{other.pk}/{action}/'
+            endpoints += [('POST', url), ('DELETE', url)]
+    author = User.objects.exclude(pk=user.pk).exclude(
+        subscribers__subscriber=user).order_by('pk').first()
+    if author is not None:
+        url = f'/api/users/{author.pk}/subscribe/'
+        endpoints += [('POST', url), ('DELETE', url)]
+    if user.is_staff:
+        endpoints.append(('GET', '/api/auth/throttle_stats/'))
+    return endpoints
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+def benchmark_endpoints(user, endpoints, repeat=20, warmup=2):
+    """Замеры эндпоинтов от имени user.
+
+    Запросы идут через тестовый клиент Django в этом же процессе,
+    то есть без сети, но со всей цепочкой middleware и базой. Каждый
+    повтор проходит по всем эндпоинтам по порядку, так что пары
+    «создать — удалить» чередуются. Возвращает
+    {'МЕТОД url': {'p50', 'p95', 'p99', 'min', 'max' (мс), 'queries',
+    'size' (байт)}}.
+    """
+    token, _ = Token.objects.get_or_create(user=user)
+    host = next((host for host in settings.ALLOWED_HOSTS if host != '*'),
+                'localhost').lstrip('.')
+    client = Client(HTTP_AUTHORIZATION=f'Token {token.key}',
+                    HTTP_HOST=host)
+    timings = {endpoint: [] for endpoint in endpoints}
+    queries = {endpoint: [] for endpoint in endpoints}
+    sizes = {}
+    for attempt in range(warmup + repeat):
+        for method, url in endpoints:
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                started = time.perf_counter()
+                response = client.generic(method, url)
+                content = (b''.join(response.streaming_content)
+                           if response.streaming else response.content)
+                elapsed = (time.perf_counter() - started) * 1000
+            if not 200 <= response.status_code < 300:
+                raise RuntimeError(
+                    f'{method} {url}: {response.status_code}')
+            if attempt >= warmup:
+                timings[method, url].append(elapsed)
+                queries[method, url].append(recorder.count)
+                sizes[method, url] = len(content)
+    return {
+        f'{method} {url}': {
+            'p50': percentile(timings[method, url], 50),
+            'p95': percentile(timings[method, url], 95),
+            'p99': percentile(timings[method, url], 99),
+            'min': min(timings[method, url]),
+            'max': max(timings[method, url]),
+            'queries': max(queries[method, url]),
+            'size': sizes[method, url],
+        }
+        for method, url in endpoints
+    }
+
+
+def compare_results(baseline, results, threshold=20):
+    """Регрессии относительно прошлого прогона.
+
+    Эндпоинт считается регрессией, если его p50 вырос больше чем на
+    threshold процентов или стало больше запросов к базе. Возвращает
+    список строк с описанием.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p50'] > previous['p50'] * (1 + threshold / 100):
+            regressions.append(
+                f'{name}: p50 {previous["p50"]:.1f} → '
+                f'{current["p50"]:.1f} мс')
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: запросов {previous["queries"]} → '
+                f'{current["queries"]}')
+    return regressions
@@ -0,0 +1,128 @@
+import threading
+from bisect import bisect_left
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CatalogVersion, Ingredient
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+
+
+def get_cache_key(name):
+    return f'catalog-version:{name}'
+
+
+def get_catalog_versions(*names):
+    """Версии справочников, общие для всех процессов.
+
+    Источник — таблица CatalogVersion; кэш Django держит значение
+    не дольше CATALOG_VERSION_TTL секунд. С кэшем процесса (LocMemCache)
+    смену из другого процесса воркер увидит не позже этого срока,
+    с общим кэшем — сразу.
+    """
+    keys = {get_cache_key(name): name for name in names}
+    versions = {keys[key]: value
+                for key, value in cache.get_many(keys).items()}
+    missing = [name for name in names if name not in versions]
+    if missing:
+        fetched = dict(CatalogVersion.objects.filter(
+            name__in=missing).values_list('name', 'version'))
+        for name in missing:
+            versions[name] = fetched.get(name, '')
+        cache.set_many({get_cache_key(name): versions[name]
+                        for name in missing},
+                       timeout=settings.CATALOG_VERSION_TTL)
+    return tuple(versions[name] for name in names)
+
+
+def get_catalog_version(name):
+    return get_catalog_versions(name)[0]
+
+
+def bump_catalog_version(name):
+    """Меняет версию справочника в текущей транзакции.
+
+    Кэш сбрасывается после коммита, чтобы до него никто не закэшировал
+    новую версию со старыми данными.
+    """
+    CatalogVersion.objects.update_or_create(
+        name=name, defaults={'version': uuid4().hex})
+    transaction.on_commit(lambda: cache.delete(get_cache_key(name)))
+
+
+class IngredientIndex:
+    """Отсортированный по названию массив ингредиентов для автодополнения.
+
+    Сначала выдаются совпадения по началу названия (бинарный поиск),
+    затем совпадения по подстроке.
+    """
+
+    def __init__(self, ingredients):
+        rows = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in ingredients
+        )
+        self.keys = [row[0] for row in rows]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+
+    def search(self, query, limit):
+        query = query.lower()
+        start = bisect_left(self.keys, query)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(query):
+            end += 1
+        results = self.items[start:min(end, start + limit)]
+        if len(results) < limit:
+            for position, key in enumerate(self.keys):
+                if start <= position < end or query not in key:
+                    continue
+                results.append(self.items[position])
+                if len(results) == limit:
+                    break
+        return results
+
+
+_index_lock = threading.Lock()
+_index = (None, None)
+
+
+def get_ingredient_index():
+    """Индекс ингредиентов текущего воркера.
+
+    Пересобирается при смене версии справочника.
+    """
+    global _index
+    version = get_catalog_version(INGREDIENTS)
+    if _index[0] != version:
+        with _index_lock:
+            if _index[0] != version:
+                _index = (version, IngredientIndex(
+                    Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit').iterator()
+                ))
+    return _index[1]
+
+
+_rendered_lock = threading.Lock()
+_rendered = {}
+
+
+def get_rendered(name, key, version, render):
+    """Отрендеренный ответ справочника из кэша воркера.
+
+    render вызывается, только если для текущей версии ответа ещё нет.
+    """
+    cached = _rendered.get((name, key))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    body = render()
+    with _rendered_lock:
+        _rendered[(name, key)] = (version, body)
+    return body
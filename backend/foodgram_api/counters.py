@@ -0,0 +1,63 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Favorites, Recipe, ShoppingCartItem, Subscription, User
+
+# (модель, поле счётчика, что считаем, внешний ключ на модель)
+COUNTERS = [
+    (Recipe, 'favorites_count', Favorites, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCartItem, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'user'),
+]
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счётчик в базе, не опуская его ниже нуля."""
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    model.objects.filter(pk=pk).update(**{field: value})
+
+
+def delete_once(instance):
+    """Удаляет объект так, чтобы сигналы счётчиков сработали один раз.
+
+    Строка блокируется до конца транзакции: параллельное удаление того
+    же объекта дождётся коммита и уже не найдёт его. Возвращает, удалил
+    ли объект этот вызов; нужна открытая транзакция.
+    """
+    model = type(instance)
+    for locked in model.objects.select_for_update().filter(pk=instance.pk):
+        locked.delete()
+        return True
+    return False
+
+
+def count_subquery(related_model, foreign_key):
+    return Coalesce(Subquery(
+        related_model.objects.filter(
+            **{foreign_key: OuterRef('pk')}
+        ).order_by().values(foreign_key).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def reconcile_counters(fix=True):
+    """Сверяет счётчики с реальным числом строк.
+
+    Возвращает {'Model.field': число строк с расхождением}; при fix
+    расхождения исправляются.
+    """
+    drift = {}
+    for model, field, related_model, foreign_key in COUNTERS:
+        actual = count_subquery(related_model, foreign_key)
+        wrong = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}).values('pk')
+        if fix:
+            drift[f'{model.__name__}.{field}'] = model.objects.filter(
+                pk__in=wrong).update(**{field: actual})
+        else:
+            drift[f'{model.__name__}.{field}'] = wrong.count()
+    return drift
@@ -1,14 +1,20 @@
 from django_filters import rest_framework as filters
 
-from .models import Recipe, User
+from .models import Recipe, Tag, User
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = filters.ModelMultipleChoiceFilter(field_name='tags__slug',
+                                             to_field_name='slug',
+                                             queryset=Tag.objects.all())
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
+    is_favorited = filters.BooleanFilter(
+        method='filter_by_user_flag'
+    )
     is_in_shopping_cart = filters.BooleanFilter(
-        method='filter_is_in_shopping_cart'
+        method='filter_by_user_flag'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
@@ -17,8 +23,12 @@ class RecipeFilter(filters.FilterSet):
             'author',
         ]
 
-    def filter_is_in_shopping_cart(self, queryset, name, value):
+    def filter_by_user_flag(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            return queryset.filter(shoppingcartitem__user=self.request.user)
+            if name not in queryset.query.annotations:
+                queryset = queryset.with_user_flags(self.request.user)
+            return queryset.filter(**{name: True})
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
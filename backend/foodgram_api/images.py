@@ -0,0 +1,112 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return _executor
+
+
+def encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def render_variants(source):
+    """Миниатюра и WebP-варианты картинки.
+
+    Возвращает словарь {поле модели: (суффикс имени, содержимое)}.
+    Миниатюра обрезается по центру до RECIPE_THUMBNAIL_SIZE.
+    """
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = (image.mode in ('RGBA', 'LA', 'PA')
+                     or 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    thumbnail = ImageOps.fit(image, settings.RECIPE_THUMBNAIL_SIZE,
+                             Image.Resampling.LANCZOS)
+    quality = settings.RECIPE_IMAGE_QUALITY
+    if has_alpha:
+        thumbnail_file = ('_thumb.png', encode(thumbnail, 'PNG',
+                                               optimize=True))
+    else:
+        thumbnail_file = ('_thumb.jpg', encode(thumbnail, 'JPEG',
+                                               quality=quality,
+                                               optimize=True,
+                                               progressive=True))
+    return {
+        'thumbnail': thumbnail_file,
+        'thumbnail_webp': ('_thumb.webp', encode(thumbnail, 'WEBP',
+                                                 quality=quality)),
+        'image_webp': ('.webp', encode(image, 'WEBP', quality=quality)),
+    }
+
+
+def process_recipe_image(recipe_id):
+    """Строит производные картинки рецепта и сохраняет их в модель.
+
+    Если пока шла обработка картинку рецепта заменили или рецепт
+    удалили, результат не сохраняется: файлы без ссылок удалит
+    команда collect_media.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    original = recipe.image.name
+    with recipe.image.open('rb') as source:
+        variants = render_variants(source)
+    stem = os.path.splitext(original)[0]
+    names = {
+        field: default_storage.save(f'{stem}{suffix}', content)
+        for field, (suffix, content) in variants.items()
+    }
+    Recipe.objects.filter(pk=recipe_id, image=original).update(
+        updated=timezone.now(), **names
+    )
+
+
+def run_in_background(recipe_id):
+    close_old_connections()
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать картинку рецепта %s',
+                         recipe_id)
+    finally:
+        # У потока пула своё соединение, запрос его не закроет
+        connections.close_all()
+
+
+def schedule_image_processing(recipe):
+    """Ставит обработку картинки рецепта в очередь после коммита.
+
+    При IMAGE_PROCESSING_ASYNC=False обработка идёт сразу в том же потоке.
+    """
+    recipe_id = recipe.pk
+    if settings.IMAGE_PROCESSING_ASYNC:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_background, recipe_id)
+        )
+    else:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
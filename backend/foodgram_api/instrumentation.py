@@ -0,0 +1,103 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+SQL_LOG_LENGTH = 300
+
+
+class QueryRecorder:
+    """execute_wrapper: число запросов к базе, их время и повторы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+
+class RequestTimingMiddleware:
+    """Замеры запроса: база, view, рендеринг.
+
+    Результат уходит в заголовок Server-Timing, а запросы дольше
+    SLOW_REQUEST_THRESHOLD миллисекунд пишутся в лог одной JSON-строкой
+    с именем маршрута и самыми частыми повторяющимися SQL. Время view
+    включает сериализацию DRF; рендеринг отделяется только у ответов
+    с отложенным рендерингом (Response DRF, TemplateResponse), тело
+    потоковых ответов не замеряется. Накладные расходы — один
+    execute_wrapper и счётчик строк SQL на запрос.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request.view_started = request.view_finished = None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        view_started = request.view_started or started
+        view_finished = request.view_finished or finished
+        timings = {
+            'db': recorder.duration * 1000,
+            'view': (view_finished - view_started) * 1000,
+            'render': (finished - view_finished) * 1000,
+            'total': (finished - started) * 1000,
+        }
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={duration:.1f}'
+                + (f';desc="{recorder.count} queries"'
+                   if name == 'db' else '')
+                for name, duration in timings.items()
+            )
+        if timings['total'] >= settings.SLOW_REQUEST_THRESHOLD:
+            self.log_slow_request(request, response, recorder, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request.view_finished = time.perf_counter()
+        return response
+
+    def log_slow_request(self, request, response, recorder, timings):
+        match = request.resolver_match
+        logger.warning(json.dumps({
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.path,
+            'url_name': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': recorder.count,
+            **{name: round(duration, 1)
+               for name, duration in timings.items()},
+            'repeated_queries': [
+                {'sql': sql[:SQL_LOG_LENGTH], 'count': count}
+                for sql, count in recorder.statements.most_common(
+                    settings.SLOW_REQUEST_TOP_QUERIES)
+                if count > 1
+            ],
+        }, ensure_ascii=False))
@@ -0,0 +1,94 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from foodgram_api.benchmark import SEED_PREFIX, benchmark_endpoints, \
+    compare_results, get_benchmark_endpoints, seed_dataset
+from foodgram_api.models import Recipe, User
+
+
+class Command(BaseCommand):
+    help = ('Команда для замера эндпоинтов API: перцентили времени '
+            'ответа, число запросов к базе и размер ответа. Результат '
+            'можно сохранить в JSON и сравнить с прошлым прогоном')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='USERS',
+            help='Сначала добавить столько синтетических пользователей '
+                 'с рецептами, избранным, корзиной и подписками'
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--email',
+            help='От чьего имени слать запросы, по умолчанию — первый '
+                 'синтетический пользователь'
+        )
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+        parser.add_argument(
+            '--compare', metavar='PATH',
+            help='Сравнить с сохранённым прогоном и завершиться ошибкой '
+                 'при регрессии'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=20,
+            help='Допустимый рост p50 в процентах для --compare'
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            users, recipes = seed_dataset(users=options['seed'])
+            self.stdout.write(
+                f'Добавлено пользователей: {users}, рецептов: {recipes}')
+        users = User.objects.order_by('pk')
+        if options['email']:
+            user = users.filter(email=options['email']).first()
+        else:
+            user = users.filter(username__startswith=SEED_PREFIX).first()
+        if user is None:
+            raise CommandError('Нет пользователя для запросов, '
+                               'укажите --email или --seed')
+        try:
+            results = benchmark_endpoints(
+                user, get_benchmark_endpoints(user),
+                repeat=options['repeat'])
+        except RuntimeError as error:
+            raise CommandError(f'Эндпоинт ответил ошибкой: {error}')
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'meta': {
+                        'date': timezone.now().isoformat(),
+                        'database': connection.vendor,
+                        'repeat': options['repeat'],
+                        'users': User.objects.count(),
+                        'recipes': Recipe.objects.count(),
+                    },
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)['results']
+            regressions = compare_results(baseline, results,
+                                          options['threshold'])
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(
+                    f'Найдено регрессий: {len(regressions)}')
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def print_results(self, results):
+        width = max(len(name) for name in results)
+        self.stdout.write(
+            f'{"эндпоинт":<{width}}     p50     p95     p99  запросов'
+            '   байт')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<{width}} {result["p50"]:7.1f} '
+                f'{result["p95"]:7.1f} {result["p99"]:7.1f} '
+                f'{result["queries"]:9} {result["size"]:6}'
+            )
@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodgram_api.models import Recipe
+from foodgram_api.storage import CONTENT_DIR
+
+IMAGE_FIELDS = ['image', 'image_webp', 'thumbnail', 'thumbnail_webp']
+
+
+def iter_files(storage, path):
+    try:
+        directories, files = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield f'{path}/{name}'
+    for directory in directories:
+        yield from iter_files(storage, f'{path}/{directory}')
+
+
+def get_referenced_names():
+    names = set()
+    for row in Recipe.objects.values_list(*IMAGE_FIELDS).iterator():
+        names.update(name for name in row if name)
+    return names
+
+
+class Command(BaseCommand):
+    help = ('Команда для удаления картинок, на которые '
+            'не ссылается ни один рецепт')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=3600,
+            help='Не трогать файлы моложе указанного числа секунд: '
+                 'они могут принадлежать незакоммиченной транзакции'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено'
+        )
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - timedelta(seconds=options['grace'])
+        # Смотрим только каталог хранилища по содержимому: остальное
+        # в MEDIA_ROOT (.gitkeep, чужие файлы) команде не принадлежит.
+        # Время изменения проверяем после чтения ссылок: файл, сохранённый
+        # или повторно использованный до коммита ссылки на него, моложе
+        # порога и не будет удалён
+        names = list(iter_files(default_storage, CONTENT_DIR))
+        referenced = get_referenced_names()
+        garbage = [
+            name for name in names
+            if name not in referenced
+            and default_storage.get_modified_time(name) < threshold
+        ]
+        for name in garbage:
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов без ссылок: {len(garbage)}'
+            + (' (не удалены)' if options['dry_run'] else '')
+        ))
@@ -0,0 +1,87 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from foodgram_api.models import IngredientToRecipe, Recipe
+
+BATCH_SIZE = 1000
+
+
+def recipe_to_dict(recipe):
+    return {
+        'author': recipe.author.email,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': recipe.image.name,
+        'image_webp': recipe.image_webp.name,
+        'thumbnail': recipe.thumbnail.name,
+        'thumbnail_webp': recipe.thumbnail_webp.name,
+        'created': recipe.created.isoformat(),
+        'updated': recipe.updated.isoformat(),
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredienttorecipe_set.all()
+        ],
+    }
+
+
+def iter_recipe_batches(batch_size):
+    """Рецепты пачками по первичному ключу, со связями каждой пачки."""
+    queryset = Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredienttorecipe_set',
+            queryset=IngredientToRecipe.objects.select_related(
+                'ingredient').order_by('pk')
+        ),
+    ).order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+class Command(BaseCommand):
+    help = ('Команда для выгрузки рецептов с ингредиентами и тегами '
+            'в NDJSON: один рецепт на строку. Картинки в выгрузку '
+            'не входят, переносится только их имя в хранилище')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию stdout'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            self.export(self.stdout.write, options['batch_size'])
+            return
+        with open(options['path'], 'w', encoding='utf-8') as file:
+            self.export(lambda line: file.write(line + '\n'),
+                        options['batch_size'])
+
+    def export(self, write, batch_size):
+        started = time.monotonic()
+        exported = 0
+        for batch in iter_recipe_batches(batch_size):
+            for recipe in batch:
+                write(json.dumps(recipe_to_dict(recipe), ensure_ascii=False))
+            exported += len(batch)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        # Итог в stderr, чтобы не смешивать его с выгрузкой в stdout
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported}, '
+            f'{exported / elapsed:.0f} в секунду'
+        ))
@@ -0,0 +1,172 @@
+import json
+import sys
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from foodgram_api.counters import change_counter
+from foodgram_api.models import Ingredient, IngredientToRecipe, Recipe, \
+    Tag, User
+
+BATCH_SIZE = 1000
+IMAGE_FIELDS = ['image', 'image_webp', 'thumbnail', 'thumbnail_webp']
+
+
+class UnresolvedReferenceError(Exception):
+    pass
+
+
+def iter_batches(file, batch_size):
+    """Пачки (номер строки, запись) из NDJSON-файла."""
+    batch = []
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            raise CommandError(f'Строка {line_number}: {error}')
+        if not isinstance(row, dict):
+            raise CommandError(f'Строка {line_number}: ожидался объект')
+        batch.append((line_number, row))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Команда для загрузки рецептов из NDJSON, выгруженного '
+            'export_recipes. Каждая пачка загружается в своей транзакции')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл с рецептами, по умолчанию stdin'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        self.tags = {}
+        self.imported = self.skipped = 0
+        self.started = time.monotonic()
+        if options['path'] == '-':
+            self.load(sys.stdin, options['batch_size'])
+        else:
+            with open(options['path'], encoding='utf-8') as file:
+                self.load(file, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(self.progress()))
+
+    def progress(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (f'Загружено рецептов: {self.imported}, '
+                f'пропущено: {self.skipped}, '
+                f'{self.imported / elapsed:.0f} в секунду')
+
+    def load(self, file, batch_size):
+        for batch in iter_batches(file, batch_size):
+            self.load_batch(batch)
+            self.stdout.write(self.progress())
+
+    def resolve_tags(self, slugs):
+        """Id тегов по слагам; теги запоминаются на всю загрузку."""
+        missing = set(slugs) - self.tags.keys()
+        if missing:
+            self.tags.update(Tag.objects.filter(
+                slug__in=missing
+            ).order_by('-pk').values_list('slug', 'pk'))
+
+    def load_batch(self, batch):
+        authors = dict(User.objects.filter(
+            email__in={row.get('author') for _, row in batch}
+        ).values_list('email', 'pk'))
+        self.resolve_tags(
+            slug for _, row in batch for slug in row.get('tags', []))
+        ingredient_names = {
+            item.get('name')
+            for _, row in batch for item in row.get('ingredients', [])
+        }
+        # При дублях в справочнике берём ингредиент с меньшим id
+        ingredients = {
+            (name, measurement_unit): pk
+            for name, measurement_unit, pk in Ingredient.objects.filter(
+                name__in=ingredient_names
+            ).order_by('-pk').values_list('name', 'measurement_unit', 'pk')
+        }
+        recipes = []
+        for line_number, row in batch:
+            try:
+                recipe = self.build_recipe(row, authors, ingredients)
+            except UnresolvedReferenceError as error:
+                self.skipped += 1
+                self.stderr.write(f'Строка {line_number}: {error}')
+                continue
+            except (KeyError, TypeError, ValueError) as error:
+                raise CommandError(
+                    f'Строка {line_number}: неверная запись ({error!r})')
+            recipes.append(recipe)
+        with transaction.atomic():
+            self.save_recipes([recipe for recipe, _, _ in recipes])
+            IngredientToRecipe.objects.bulk_create([
+                IngredientToRecipe(recipe=recipe, ingredient_id=pk,
+                                   amount=amount)
+                for recipe, links, _ in recipes for pk, amount in links
+            ])
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=pk)
+                for recipe, _, tags in recipes for pk in tags
+            ])
+        self.imported += len(recipes)
+
+    def build_recipe(self, row, authors, ingredients):
+        if row['author'] not in authors:
+            raise UnresolvedReferenceError(f'нет пользователя {row["author"]}')
+        tags = set()
+        for slug in row['tags']:
+            if slug not in self.tags:
+                raise UnresolvedReferenceError(f'нет тега {slug}')
+            tags.add(self.tags[slug])
+        links = []
+        for item in row['ingredients']:
+            key = (item['name'], item['measurement_unit'])
+            if key not in ingredients:
+                raise UnresolvedReferenceError(
+                    f'нет ингредиента {key[0]} ({key[1]})')
+            links.append((ingredients[key], int(item['amount'])))
+        recipe = Recipe(
+            author_id=authors[row['author']],
+            name=row['name'],
+            text=row['text'],
+            cooking_time=int(row['cooking_time']),
+            **{field: row.get(field) or '' for field in IMAGE_FIELDS}
+        )
+        recipe.imported_dates = (parse_datetime(row.get('created') or ''),
+                                 parse_datetime(row.get('updated') or ''))
+        return recipe, links, tags
+
+    def save_recipes(self, recipes):
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            # bulk_create не отправляет сигналы, счётчики увеличиваем сами
+            for author_id, total in Counter(
+                recipe.author_id for recipe in recipes
+            ).items():
+                change_counter(User, author_id, 'recipes_count', total)
+        else:
+            # Без RETURNING bulk_create не заполняет id новых строк
+            for recipe in recipes:
+                recipe.save()
+        # auto_now_add и auto_now перезаписывают даты при вставке,
+        # bulk_update возвращает выгруженные
+        dated = []
+        for recipe in recipes:
+            created, updated = recipe.imported_dates
+            if created:
+                recipe.created = created
+                recipe.updated = updated or created
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ['created', 'updated'])
@@ -1,16 +1,125 @@
+import csv
 import json
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from foodgram_api.catalog import INGREDIENTS, bump_catalog_version
 from foodgram_api.models import Ingredient
-from django.core.management.base import BaseCommand
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+SEPARATOR = re.compile(r'[\s,]*')
+DEFAULT_PATH = settings.BASE_DIR.parent / 'data' / 'ingredients.json'
+
+
+def iter_json(file):
+    """Объекты верхнеуровневого JSON-массива, файл читается частями."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив')
+    position = 1
+    eof = False
+    while True:
+        position = SEPARATOR.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError as error:
+            if eof:
+                raise CommandError(f'Неверный JSON: {error}')
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_csv(file):
+    """Строки name,measurement_unit; строка заголовка пропускается."""
+    for row in csv.reader(file):
+        if not row or row == ['name', 'measurement_unit']:
+            continue
+        if len(row) != 2:
+            raise CommandError(f'Неверная строка CSV: {row}')
+        yield {'name': row[0], 'measurement_unit': row[1]}
+
+
+READERS = {
+    'json': iter_json,
+    'csv': iter_csv,
+}
+
+
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 class Command(BaseCommand):
-    help = 'Команда для загрузки ингредиентов из json-файла'
+    help = ('Команда для загрузки ингредиентов из json- или csv-файла. '
+            'Уже существующие ингредиенты пропускаются, поэтому её '
+            'можно запускать при каждом деплое')
 
-    def handle(self, *args, **options):
-        with open('../data/ingredients.json', 'r', encoding='UTF-8') as file:
-            json_data = json.load(file)
-        Ingredient.objects.bulk_create(
-            [Ingredient(**item_data) for item_data in json_data]
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, по умолчанию — по расширению'
         )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
 
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        started = time.monotonic()
+        inserted = skipped = 0
+        with open(path, encoding='utf-8', newline='') as file:
+            for batch in iter_batches(READERS[file_format](file),
+                                      options['batch_size']):
+                batch_inserted = self.load_batch(batch)
+                inserted += batch_inserted
+                skipped += len(batch) - batch_inserted
+        if inserted:
+            # bulk_create не отправляет сигналы, версию сбрасываем сами
+            bump_catalog_version(INGREDIENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено: {inserted}, пропущено: {skipped} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
 
+    def load_batch(self, batch):
+        keys = set()
+        for item in batch:
+            try:
+                keys.add((item['name'].strip(),
+                          item['measurement_unit'].strip()))
+            except (AttributeError, KeyError, TypeError):
+                raise CommandError(f'Неверная запись: {item}')
+        with transaction.atomic():
+            existing = set(Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            ).values_list('name', 'measurement_unit'))
+            new = keys - existing
+            # ignore_conflicts страхует от параллельной загрузки
+            Ingredient.objects.bulk_create([
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in sorted(new)
+            ], ignore_conflicts=True)
+        return len(new)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from foodgram_api.images import process_recipe_image
+from foodgram_api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Команда для построения миниатюр и WebP-вариантов '
+            'картинок рецептов')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить варианты и у уже обработанных рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(thumbnail='')
+        processed = failed = 0
+        for recipe_id in recipes.values_list('pk', flat=True).iterator():
+            try:
+                process_recipe_image(recipe_id)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}, с ошибками: {failed}'))
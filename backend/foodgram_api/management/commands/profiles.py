@@ -0,0 +1,51 @@
+import pstats
+from datetime import datetime
+from io import StringIO
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodgram_api.profiling import get_profile_dir, get_profiles
+
+SORT_KEYS = ['cumulative', 'tottime', 'ncalls']
+
+
+class Command(BaseCommand):
+    help = ('Команда для просмотра профилей запросов: без аргументов '
+            'выводит список, с именем файла или маршрута — сводку '
+            'последнего подходящего профиля')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'name', nargs='?',
+            help='Имя файла профиля или начало имени маршрута'
+        )
+        parser.add_argument('--sort', choices=SORT_KEYS,
+                            default='cumulative')
+        parser.add_argument('--limit', type=int, default=30,
+                            help='Сколько функций вывести в сводке')
+
+    def handle(self, *args, **options):
+        profile_dir = get_profile_dir()
+        profiles = get_profiles(profile_dir)
+        name = options['name']
+        if name is None:
+            if not profiles:
+                self.stdout.write(f'В {profile_dir} нет профилей')
+            for path in profiles:
+                modified = datetime.fromtimestamp(path.stat().st_mtime)
+                self.stdout.write(
+                    f'{modified:%Y-%m-%d %H:%M:%S}  '
+                    f'{path.stat().st_size // 1024:6} КБ  {path.name}'
+                )
+            return
+        path = next((path for path in profiles
+                     if path.name == name or path.name.startswith(name)),
+                    None)
+        if path is None:
+            raise CommandError(f'Профиль {name} не найден')
+        output = StringIO()
+        stats = pstats.Stats(str(path), stream=output)
+        stats.strip_dirs().sort_stats(options['sort']).print_stats(
+            options['limit'])
+        self.stdout.write(path.name)
+        self.stdout.write(output.getvalue())
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from foodgram_api.models import ShoppingListItem
+from foodgram_api.shopping_cart import calculate_shopping_lists
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Команда для пересборки списков покупок по корзинам '
+            'и проверки их на расхождения')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = calculate_shopping_lists()
+            actual = {
+                (user_id, ingredient_id): (pk, amount)
+                for pk, user_id, ingredient_id, amount
+                in ShoppingListItem.objects.select_for_update().values_list(
+                    'pk', 'user_id', 'ingredient_id', 'amount'
+                ).iterator()
+            }
+            missing = [
+                ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                                 amount=amount)
+                for (user_id, ingredient_id), amount in expected.items()
+                if (user_id, ingredient_id) not in actual
+            ]
+            wrong = [
+                ShoppingListItem(pk=pk, amount=expected[key])
+                for key, (pk, amount) in actual.items()
+                if key in expected and expected[key] != amount
+            ]
+            stale = [
+                pk for key, (pk, amount) in actual.items()
+                if key not in expected
+            ]
+            self.stdout.write(
+                f'Отсутствует строк: {len(missing)}, '
+                f'с неверным количеством: {len(wrong)}, '
+                f'лишних: {len(stale)}'
+            )
+            drift = len(missing) + len(wrong) + len(stale)
+            if options['check']:
+                if drift:
+                    raise CommandError(f'Найдено расхождений: {drift}')
+                return
+            ShoppingListItem.objects.bulk_create(missing,
+                                                 batch_size=BATCH_SIZE)
+            ShoppingListItem.objects.bulk_update(wrong, ['amount'],
+                                                 batch_size=BATCH_SIZE)
+            for start in range(0, len(stale), BATCH_SIZE):
+                ShoppingListItem.objects.filter(
+                    pk__in=stale[start:start + BATCH_SIZE]).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено расхождений: {drift}'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from foodgram_api.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Команда для сверки счётчиков избранного, корзин, рецептов '
+            'и подписчиков с данными и исправления расхождений')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить расхождения, ничего не меняя'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = reconcile_counters(fix=not options['check'])
+        for name, rows in drift.items():
+            self.stdout.write(f'{name}: {rows}')
+        total = sum(drift.values())
+        if options['check']:
+            if total:
+                raise CommandError(f'Найдено расхождений: {total}')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено расхождений: {total}'))
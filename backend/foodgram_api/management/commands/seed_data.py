@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from foodgram_api.benchmark import SEED_PREFIX, seed_dataset
+from foodgram_api.models import User
+
+
+class Command(BaseCommand):
+    help = ('Команда для генерации синтетических пользователей, рецептов, '
+            'избранного, корзин и подписок для замеров производительности')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes-per-user', type=int, default=10)
+        parser.add_argument('--ingredients-per-recipe', type=int,
+                            default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int,
+                            default=10)
+        parser.add_argument('--random-seed', type=int, default=0)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Сначала удалить ранее сгенерированных пользователей '
+                 'вместе с их рецептами и связями'
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = User.objects.filter(
+                username__startswith=SEED_PREFIX).delete()
+            self.stdout.write(f'Удалено объектов: {deleted}')
+        users, recipes = seed_dataset(
+            users=options['users'],
+            recipes_per_user=options['recipes_per_user'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            favorites_per_user=options['favorites_per_user'],
+            cart_per_user=options['cart_per_user'],
+            subscriptions_per_user=options['subscriptions_per_user'],
+            random_seed=options['random_seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено пользователей: {users}, рецептов: {recipes}'))
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    IngredientToRecipe = apps.get_model('foodgram_api', 'IngredientToRecipe')
+    ShoppingListItem = apps.get_model('foodgram_api', 'ShoppingListItem')
+    rows = IngredientToRecipe.objects.filter(
+        recipe__shoppingcartitem__isnull=False
+    ).values_list(
+        'recipe__shoppingcartitem__user', 'ingredient'
+    ).annotate(total=models.Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=amount)
+            for user_id, ingredient_id, amount in rows
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='favorites',
+            options={'verbose_name': 'Избранное', 'verbose_name_plural': 'Избранное'},
+        ),
+        migrations.AlterModelOptions(
+            name='shoppingcartitem',
+            options={'verbose_name': 'Элемент корзины', 'verbose_name_plural': 'Элементы корзины'},
+        ),
+        migrations.AlterModelOptions(
+            name='subscription',
+            options={'verbose_name': 'Подписка', 'verbose_name_plural': 'Подписки'},
+        ),
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='foodgram_api.ingredient', verbose_name='ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'Строка списка покупок',
+                'verbose_name_plural': 'Строки списка покупок',
+                'unique_together': {('user', 'ingredient')},
+            },
+        ),
+        migrations.RunPython(fill_shopping_lists,
+                             migrations.RunPython.noop),
+    ]
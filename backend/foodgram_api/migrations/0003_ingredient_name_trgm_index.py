@@ -0,0 +1,32 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Выражение совпадает с тем, что Django строит для icontains/istartswith
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS foodgram_ingredient_name_trgm '
+        'ON foodgram_api_ingredient USING gin (UPPER(name::text) gin_trgm_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS foodgram_ingredient_name_trgm'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_api', '0002_shoppinglistitem'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:38
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+CREATE_SEARCH_VECTOR_SQL = [
+    '''
+    CREATE OR REPLACE FUNCTION foodgram_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    CREATE TRIGGER foodgram_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON foodgram_api_recipe
+    FOR EACH ROW EXECUTE PROCEDURE foodgram_recipe_search_vector_update()
+    ''',
+    'UPDATE foodgram_api_recipe SET name = name',
+    '''
+    CREATE INDEX foodgram_recipe_search_vector_idx
+    ON foodgram_api_recipe USING gin (search_vector)
+    ''',
+]
+
+DROP_SEARCH_VECTOR_SQL = [
+    'DROP INDEX IF EXISTS foodgram_recipe_search_vector_idx',
+    'DROP TRIGGER IF EXISTS foodgram_recipe_search_vector_trigger '
+    'ON foodgram_api_recipe',
+    'DROP FUNCTION IF EXISTS foodgram_recipe_search_vector_update()',
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_api', '0005_recipe_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgresql(CREATE_SEARCH_VECTOR_SQL),
+                             run_on_postgresql(DROP_SEARCH_VECTOR_SQL)),
+    ]
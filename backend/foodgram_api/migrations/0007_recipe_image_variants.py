@@ -0,0 +1,28 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_api', '0006_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_webp',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='картинка WebP'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='миниатюра'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnail_webp',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='миниатюра WebP'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:45
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """Переносит ссылки дублей на ингредиент с меньшим id и удаляет дубли.
+
+    Строки списков покупок одного пользователя сливаются, количества
+    складываются.
+    """
+    Ingredient = apps.get_model('foodgram_api', 'Ingredient')
+    IngredientToRecipe = apps.get_model('foodgram_api', 'IngredientToRecipe')
+    ShoppingListItem = apps.get_model('foodgram_api', 'ShoppingListItem')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), total=Count('id')).filter(total__gt=1)
+    for row in duplicates.iterator():
+        duplicate_ids = list(Ingredient.objects.filter(
+            name=row['name'], measurement_unit=row['measurement_unit']
+        ).exclude(id=row['keep']).values_list('id', flat=True))
+        IngredientToRecipe.objects.filter(
+            ingredient_id__in=duplicate_ids).update(ingredient_id=row['keep'])
+        for item in ShoppingListItem.objects.filter(
+                ingredient_id__in=duplicate_ids):
+            kept, created = ShoppingListItem.objects.get_or_create(
+                user_id=item.user_id, ingredient_id=row['keep'],
+                defaults={'amount': item.amount}
+            )
+            if not created:
+                kept.amount += item.amount
+                kept.save(update_fields=['amount'])
+            item.delete()
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+    # В PostgreSQL удаление дублей оставляет отложенные проверки внешних
+    # ключей, с ними нельзя менять таблицу в той же транзакции
+    atomic = False
+
+    dependencies = [
+        ('foodgram_api', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
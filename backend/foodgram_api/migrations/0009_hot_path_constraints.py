@@ -0,0 +1,58 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def remove_duplicates(apps, schema_editor):
+    """Удаляет дубли избранного и сливает дубли ингредиентов рецепта.
+
+    Количества дублей ингредиента складываются, поэтому списки покупок,
+    посчитанные по корзинам, не меняются.
+    """
+    Favorites = apps.get_model('foodgram_api', 'Favorites')
+    IngredientToRecipe = apps.get_model('foodgram_api', 'IngredientToRecipe')
+    for row in Favorites.objects.values('user', 'recipe').annotate(
+            keep=Min('id'), total=Count('id')).filter(total__gt=1):
+        Favorites.objects.filter(
+            user=row['user'], recipe=row['recipe']
+        ).exclude(id=row['keep']).delete()
+    for row in IngredientToRecipe.objects.values(
+            'recipe', 'ingredient'
+    ).annotate(
+        keep=Min('id'), total=Count('id'), amount_sum=Sum('amount')
+    ).filter(total__gt=1):
+        links = IngredientToRecipe.objects.filter(
+            recipe=row['recipe'], ingredient=row['ingredient'])
+        links.filter(id=row['keep']).update(amount=row['amount_sum'])
+        links.exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+    # Как и в 0008: после правки данных PostgreSQL не даёт менять
+    # таблицы в той же транзакции из-за отложенных проверок ключей
+    atomic = False
+
+    dependencies = [
+        ('foodgram_api', '0008_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created', '-id'], name='recipe_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['subscriber', 'user'], name='subscription_subscriber_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorites',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredienttorecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:54
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, field, related_name, foreign_key in [
+        ('Recipe', 'favorites_count', 'Favorites', 'recipe'),
+        ('Recipe', 'carts_count', 'ShoppingCartItem', 'recipe'),
+        ('User', 'recipes_count', 'Recipe', 'author'),
+        ('User', 'subscribers_count', 'Subscription', 'user'),
+    ]:
+        related_model = apps.get_model('foodgram_api', related_name)
+        apps.get_model('foodgram_api', model_name).objects.update(**{
+            field: Coalesce(Subquery(
+                related_model.objects.filter(
+                    **{foreign_key: OuterRef('pk')}
+                ).order_by().values(foreign_key).annotate(
+                    total=Count('pk')
+                ).values('total')
+            ), 0)
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram_api', '0009_hot_path_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в корзинах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в избранном'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='число рецептов'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='число подписчиков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
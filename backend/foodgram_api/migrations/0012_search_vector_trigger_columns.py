@@ -0,0 +1,35 @@
+from django.db import migrations
+
+TRIGGER_SQL = '''
+    CREATE TRIGGER foodgram_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE {columns}ON foodgram_api_recipe
+    FOR EACH ROW EXECUTE PROCEDURE foodgram_recipe_search_vector_update()
+'''
+DROP_TRIGGER_SQL = ('DROP TRIGGER IF EXISTS '
+                    'foodgram_recipe_search_vector_trigger '
+                    'ON foodgram_api_recipe')
+
+
+def recreate_trigger(columns):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        schema_editor.execute(DROP_TRIGGER_SQL)
+        schema_editor.execute(TRIGGER_SQL.format(columns=columns))
+    return run
+
+
+class Migration(migrations.Migration):
+    """Вектор поиска пересчитывается только при изменении name и text.
+
+    Иначе его пересобирали и обновления счётчиков, и отметки updated.
+    """
+
+    dependencies = [
+        ('foodgram_api', '0011_catalog_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_trigger('OF name, text '),
+                             recreate_trigger('')),
+    ]
@@ -1,25 +1,42 @@
+from hashlib import md5
+
+from django.db import transaction
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import mixins, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from .catalog import get_catalog_version, get_rendered
+from .counters import delete_once
 from .models import User
 
 
 class CreateDestroyMixin(mixins.CreateModelMixin,
                          mixins.DestroyModelMixin):
-    """ Mixin для создания и удаления объектов для избранного и подписок"""
+    """ Mixin для создания и удаления объектов для избранного и подписок
+
+    Счётчики и списки покупок меняются сигналами (см. signals.py).
+    """
     error_message = None
 
     def get_user(self):
         return get_object_or_404(User, id=self.kwargs.get('user_pk'))
 
+    def perform_destroy(self, instance):
+        """Удаляет объект; возвращает, удалил ли его этот запрос."""
+        return delete_once(instance)
+
     def delete(self, request, *args, **kwargs):
         return self.destroy(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         if instance:
-            self.perform_destroy(instance)
+            with transaction.atomic():
+                self.perform_destroy(instance)
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response(data={'errors': self.error_message},
@@ -27,3 +44,95 @@ class CreateDestroyMixin(mixins.CreateModelMixin,
 
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
+
+
+class CatalogCacheMixin:
+    """ Mixin для справочников: готовый JSON в памяти воркера и ETag.
+
+    ETag равен версии справочника, поэтому If-None-Match проверяется
+    без обращения к базе и сериализатору.
+    """
+    catalog_name = None
+    # Справочники публичные: токен не нужен и не проверяется в базе
+    authentication_classes = []
+
+    def list(self, request, *args, **kwargs):
+        key = None if request.query_params else 'list'
+        return self.cached_response(
+            key, lambda: super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            f'detail:{kwargs.get(self.lookup_field)}',
+            lambda: super(CatalogCacheMixin, self).retrieve(
+                request, *args, **kwargs)
+        )
+
+    def cached_response(self, key, get_response):
+        if self.request.accepted_renderer.format != 'json':
+            return get_response()
+        version = get_catalog_version(self.catalog_name)
+        etag = f'"{self.catalog_name}-{version}"'
+        response = get_conditional_response(self.request, etag=etag)
+        if response is None:
+            def render():
+                return JSONRenderer().render(get_response().data)
+
+            if key is None:
+                body = render()
+            else:
+                body = get_rendered(self.catalog_name, key, version, render)
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class ConditionalGetMixin:
+    """ Mixin для условных GET по ETag и Last-Modified.
+
+    Валидаторы считаются лёгкими запросами до сериализации:
+    get_list_validators() и get_detail_validators() возвращают
+    (части ETag, время изменения или None) либо None, если
+    условный ответ невозможен.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_validators(),
+            lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_detail_validators(),
+            lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs)
+        )
+
+    def get_list_validators(self):
+        return None
+
+    def get_detail_validators(self):
+        return None
+
+    def conditional_response(self, validators, get_response):
+        if validators is None:
+            return get_response()
+        etag_parts, last_modified = validators
+        etag = '"{}"'.format(md5(repr(
+            (self.request.accepted_renderer.format, *etag_parts)
+        ).encode()).hexdigest())
+        timestamp = None
+        if last_modified is not None:
+            timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(self.request, etag=etag,
+                                            last_modified=timestamp)
+        if response is None:
+            response = get_response()
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
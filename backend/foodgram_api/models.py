@@ -1,7 +1,11 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchQuery, SearchRank, \
+    SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import MinLengthValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models.expressions import RawSQL, Window
+from django.db.models.functions import RowNumber
 
 
 class User(AbstractUser):
@@ -13,6 +17,15 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
 
     email = models.EmailField(unique=True, verbose_name='email')
+    # Профиль автора выводится в рецептах и входит в их ETag
+    updated = models.DateTimeField(auto_now=True,
+                                   verbose_name='дата изменения')
+    # Счётчики обновляются F-выражениями из сигналов (signals.py),
+    # расхождения исправляет команда reconcile_counters
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='число рецептов')
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='число подписчиков')
 
 
 class Tag(models.Model):
@@ -33,6 +46,10 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'ингридиент'
         verbose_name_plural = 'ингридиенты'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient'),
+        ]
 
     name = models.CharField(max_length=255,
                             verbose_name='название')
@@ -47,6 +64,10 @@ class IngredientToRecipe(models.Model):
     class Meta:
         verbose_name = 'связь ингредиента с рецептом'
         verbose_name_plural = 'связи ингредиентов с рецептами'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'ingredient'],
+                                    name='unique_recipe_ingredient'),
+        ]
 
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
                                    related_name='amount',
@@ -56,15 +77,110 @@ class IngredientToRecipe(models.Model):
     amount = models.PositiveIntegerField(verbose_name='количество')
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """Жадная загрузка всего, что выводит RecipeSerializer.
+
+        search_vector нужен только для поиска в SQL и не загружается.
+        """
+        return self.select_related('author').defer(
+            'search_vector').prefetch_related(
+            'tags',
+            models.Prefetch(
+                'ingredienttorecipe_set',
+                queryset=IngredientToRecipe.objects.select_related(
+                    'ingredient')
+            )
+        )
+
+    def latest_for_authors(self, author_ids, limit=None):
+        """Не больше limit новейших рецептов каждого автора одним запросом.
+
+        Рецепты нумеруются оконной функцией внутри каждого автора
+        в порядке индекса recipe_author_created_idx, результат
+        отсортирован по автору и от новых к старым, как лента.
+        """
+        if not author_ids:
+            # Пустой IN не компилируется в SQL для подзапроса ниже
+            return self.none()
+        queryset = self.filter(author_id__in=author_ids)
+        if limit is not None:
+            ranked = queryset.annotate(recipe_rank=Window(
+                expression=RowNumber(),
+                partition_by=[models.F('author_id')],
+                order_by=[models.F('created').desc(),
+                          models.F('id').desc()]
+            )).values('id', 'recipe_rank')
+            sql, params = ranked.query.sql_with_params()
+            queryset = self.filter(id__in=RawSQL(
+                f'SELECT ranked.id FROM ({sql}) ranked '
+                f'WHERE ranked.recipe_rank <= %s',
+                (*params, limit)
+            ))
+        return queryset.order_by('author_id', '-created', '-id')
+
+    def search(self, text):
+        """Полнотекстовый поиск по названию и описанию с ранжированием.
+
+        На PostgreSQL используется search_vector (русская морфология,
+        GIN-индекс), на остальных базах — icontains, где совпадение
+        в названии ранжируется выше совпадения в описании.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            query = SearchQuery(text, config='russian',
+                                search_type='websearch')
+            queryset = self.filter(search_vector=query).annotate(
+                search_rank=SearchRank(models.F('search_vector'), query))
+        else:
+            queryset = self.filter(
+                models.Q(name__icontains=text) | models.Q(text__icontains=text)
+            ).annotate(search_rank=models.Case(
+                models.When(name__icontains=text, then=models.Value(1.0)),
+                default=models.Value(0.5),
+                output_field=models.FloatField()
+            ))
+        return queryset.order_by('-search_rank', '-created', '-id')
+
+    def with_user_flags(self, user):
+        """Добавляет is_favorited и is_in_shopping_cart для пользователя."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(False, models.BooleanField()),
+                is_in_shopping_cart=models.Value(False, models.BooleanField())
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorites.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCartItem.objects.filter(
+                user=user, recipe=models.OuterRef('pk')))
+        )
+
+
 class Recipe(models.Model):
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'рецепты'
+        indexes = [
+            models.Index(fields=['-created', '-id'],
+                         name='recipe_created_id_idx'),
+            # Лента автора и последние рецепты в подписках
+            models.Index(fields=['author', '-created', '-id'],
+                         name='recipe_author_created_idx'),
+        ]
+
+    objects = RecipeQuerySet.as_manager()
 
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                verbose_name='автор')
     name = models.CharField(max_length=255, verbose_name='название')
     image = models.ImageField(verbose_name='картинка')
+    # Производные картинки заполняет фоновая обработка, см. images.py
+    image_webp = models.ImageField(blank=True, editable=False,
+                                   verbose_name='картинка WebP')
+    thumbnail = models.ImageField(blank=True, editable=False,
+                                  verbose_name='миниатюра')
+    thumbnail_webp = models.ImageField(blank=True, editable=False,
+                                       verbose_name='миниатюра WebP')
     text = models.TextField(verbose_name='описание')
     ingredients = models.ManyToManyField(Ingredient,
                                          through=IngredientToRecipe,
@@ -72,16 +188,29 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(Tag, verbose_name='тэги')
     cooking_time = models.PositiveIntegerField(
         verbose_name='время приготовления в минутах')
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='дата создания')
+    updated = models.DateTimeField(auto_now=True,
+                                   verbose_name='дата изменения')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='в избранном')
+    carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='в корзинах')
+    # Заполняется триггером PostgreSQL из name и text
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
 
 
-
 class Favorites(models.Model):
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_favorite'),
+        ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              verbose_name='пользователь',
@@ -93,6 +222,11 @@ class Favorites(models.Model):
 class Subscription(models.Model):
     class Meta:
         unique_together = ['user', 'subscriber']
+        indexes = [
+            # Подписки пользователя: id авторов читаются из индекса
+            models.Index(fields=['subscriber', 'user'],
+                         name='subscription_subscriber_idx'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
@@ -122,3 +256,38 @@ class ShoppingCartItem(models.Model):
                              related_name='cart_items')
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
                                verbose_name='рецепт')
+
+
+class ShoppingListItem(models.Model):
+    """Материализованный список покупок: сумма ингредиентов корзины."""
+
+    class Meta:
+        unique_together = [
+            'user',
+            'ingredient'
+        ]
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списка покупок'
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='пользователь',
+                             related_name='shopping_list')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   verbose_name='ингредиент')
+    amount = models.PositiveIntegerField(verbose_name='количество')
+
+
+class CatalogVersion(models.Model):
+    """Версия справочника для кэшей воркеров и ETag.
+
+    Хранится в базе, чтобы смену видели все процессы, в том числе
+    после manage.py load_ingredient.
+    """
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    name = models.CharField(max_length=50, primary_key=True,
+                            verbose_name='справочник')
+    version = models.CharField(max_length=32, verbose_name='версия')
@@ -0,0 +1,101 @@
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class LimitPageNumberPagination(PageNumberPagination):
+    """Постраничная пагинация с размером страницы из ?limit=."""
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class RecipePagination(LimitPageNumberPagination):
+    """Пагинация ленты рецептов от новых к старым.
+
+    С параметром ?cursor= (пустым для первой страницы) работает по ключу
+    (created, id) без COUNT и OFFSET, иначе — обычный ?page=.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def is_cursor_mode(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            reverse, created, pk = b64decode(
+                encoded.encode('ascii')).decode('ascii').split('|')
+            created = parse_datetime(created)
+            pk = int(pk)
+        except (BinasciiError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created is None or reverse not in ('0', '1'):
+            raise NotFound(self.invalid_cursor_message)
+        return reverse == '1', created, pk
+
+    def encode_cursor(self, recipe, reverse):
+        cursor = f'{int(reverse)}|{recipe.created.isoformat()}|{recipe.pk}'
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            b64encode(cursor.encode('ascii')).decode('ascii')
+        )
+
+    def limit_queryset(self, queryset, request):
+        """Часть выборки, которую прочитает страница курсора."""
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            self.reverse = False
+            return queryset.order_by('-created', '-id')[:page_size + 1]
+        self.reverse, created, pk = cursor
+        if self.reverse:
+            return queryset.filter(
+                Q(created__gt=created) | Q(created=created, id__gt=pk)
+            ).order_by('created', 'id')[:page_size + 1]
+        return queryset.filter(
+            Q(created__lt=created) | Q(created=created, id__lt=pk)
+        ).order_by('-created', '-id')[:page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_cursor_mode(request):
+            self.cursor_page = None
+            return super().paginate_queryset(queryset, request, view)
+        page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor_page = list(self.limit_queryset(queryset, request))
+        has_more = len(self.cursor_page) > page_size
+        self.cursor_page = self.cursor_page[:page_size]
+        if self.reverse:
+            self.cursor_page.reverse()
+        has_cursor = bool(request.query_params.get(self.cursor_query_param))
+        self.next_link = self.previous_link = None
+        if self.cursor_page:
+            if has_more or self.reverse:
+                self.next_link = self.encode_cursor(self.cursor_page[-1],
+                                                    reverse=False)
+            if (has_more and self.reverse) or (
+                    has_cursor and not self.reverse):
+                self.previous_link = self.encode_cursor(self.cursor_page[0],
+                                                        reverse=True)
+        elif has_cursor:
+            self.previous_link = replace_query_param(
+                self.base_url, self.cursor_query_param, '')
+        return self.cursor_page
+
+    def get_paginated_response(self, data):
+        if self.cursor_page is None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
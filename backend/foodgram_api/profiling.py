@@ -0,0 +1,92 @@
+import cProfile
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+PROFILE_SUFFIX = '.prof'
+UNSAFE_CHARACTERS = re.compile(r'[^\w.-]')
+
+
+def get_profile_dir():
+    return Path(settings.PROFILE_DIR)
+
+
+def get_profile_name(request):
+    match = request.resolver_match
+    route = UNSAFE_CHARACTERS.sub(
+        '_', match.view_name if match else 'unresolved')
+    timestamp = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+    return f'{route}-{timestamp}{PROFILE_SUFFIX}'
+
+
+def get_profiles(profile_dir):
+    """Профили в каталоге, от новых к старым."""
+    if not profile_dir.is_dir():
+        return []
+    return sorted(
+        profile_dir.glob(f'*{PROFILE_SUFFIX}'),
+        key=lambda path: (path.stat().st_mtime, path.name), reverse=True
+    )
+
+
+def prune_profiles(profile_dir):
+    """Оставляет в каталоге не больше PROFILE_MAX_FILES профилей."""
+    for path in get_profiles(profile_dir)[settings.PROFILE_MAX_FILES:]:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            # профиль уже удалил параллельный запрос
+            pass
+
+
+def is_staff(request):
+    """Сотрудник ли автор запроса: по сессии или по токену API."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            credentials = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        user = credentials[0] if credentials else None
+    return user is not None and user.is_staff
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос сотрудника под cProfile по запросу.
+
+    Профилирование включается заголовком X-Profile: 1 или параметром
+    ?profile=1. Профиль сохраняется в PROFILE_DIR под именем
+    <маршрут>-<время>.prof, имя файла возвращается в заголовке
+    X-Profile; смотреть профили — manage.py profiles. Хранятся
+    последние PROFILE_MAX_FILES профилей. Остальные запросы проходят
+    после одной проверки флага.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (request.META.get(PROFILE_HEADER) == '1'
+                or request.GET.get(PROFILE_PARAM) == '1'):
+            return self.get_response(request)
+        if not is_staff(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+        profile_dir = get_profile_dir()
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        name = get_profile_name(request)
+        profiler.dump_stats(profile_dir / name)
+        prune_profiles(profile_dir)
+        response['X-Profile'] = name
+        return response
@@ -0,0 +1,58 @@
+import json
+
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+from .shopping_cart import pdf_available
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Рендерер выгрузки списка покупок.
+
+    Успешный ответ отдаётся потоком в обход рендерера,
+    сюда попадают только ошибки.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class TxtRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+SHOPPING_CART_RENDERERS = [TxtRenderer, CSVRenderer, PDFRenderer]
+
+
+def get_shopping_cart_renderers():
+    """Доступные форматы выгрузки: PDF — только с рабочим шрифтом."""
+    return [
+        renderer for renderer in SHOPPING_CART_RENDERERS
+        if renderer is not PDFRenderer or pdf_available()
+    ]
+
+
+class FormatQueryParamNegotiation(DefaultContentNegotiation):
+    """Выбор рендерера только по параметру ?format=, без учёта Accept."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+        format = format_suffix or request.query_params.get(format_query_param)
+        if format:
+            renderers = self.filter_renderers(renderers, format)
+        return renderers[0], renderers[0].media_type
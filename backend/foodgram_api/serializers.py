@@ -1,15 +1,60 @@
 from django.contrib.auth.hashers import check_password
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from .images import schedule_image_processing
 from .models import User, Tag, Ingredient, Recipe, IngredientToRecipe, \
     Favorites, Subscription, ShoppingCartItem
+from .shopping_cart import sum_link_amounts, \
+    update_shopping_lists_for_recipe
+
+
+def get_subscribed_ids(context):
+    """Id авторов, на которых подписан текущий пользователь.
+
+    Считается одним запросом и кэшируется в контексте сериализатора,
+    общем для всех вложенных сериализаторов.
+    """
+    if 'subscribed_ids' not in context:
+        request = context.get('request')
+        if request is None or request.user.is_anonymous:
+            context['subscribed_ids'] = frozenset()
+        else:
+            context['subscribed_ids'] = frozenset(
+                Subscription.objects.filter(
+                    subscriber=request.user
+                ).values_list('user_id', flat=True)
+            )
+    return context['subscribed_ids']
+
+
+def get_recipes_limit(request):
+    try:
+        limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return limit if limit > 0 else None
+
+
+def get_image_url(image, context):
+    if not image:
+        return None
+    request = context.get('request')
+    if request is None:
+        return image.url
+    return request.build_absolute_uri(image.url)
+
+
+def get_card_image_url(recipe, context):
+    """Картинка для карточки: миниатюра, а пока её нет — оригинал."""
+    return get_image_url(recipe.thumbnail or recipe.image, context)
 
 
 class UserSerializer(serializers.ModelSerializer):
-    is_subscribed = serializers.BooleanField(read_only=True)
+    is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -29,6 +74,9 @@ class UserSerializer(serializers.ModelSerializer):
         validate_password(password)
         return attrs
 
+    def get_is_subscribed(self, obj):
+        return obj.id in get_subscribed_ids(self.context)
+
 
 class PasswordChangeSerializer(serializers.Serializer):
     new_password = serializers.CharField(required=True)
@@ -69,7 +117,9 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientCreateUpdateSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    # Существование ингредиентов проверяется одним запросом
+    # в RecipeCreateUpdateSerializer.validate_ingredients
+    id = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = IngredientToRecipe
@@ -82,6 +132,7 @@ class IngredientCreateUpdateSerializer(serializers.ModelSerializer):
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
     ingredients = IngredientCreateUpdateSerializer(many=True)
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
 
     class Meta:
         model = Recipe
@@ -94,38 +145,106 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             'cooking_time'
         ]
 
+    def validate_ingredients(self, value):
+        if not value:
+            raise serializers.ValidationError('Ингридиенты не выбраны')
+        amounts = {item['id']: item['amount'] for item in value}
+        if len(amounts) != len(value):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться')
+        missing = amounts.keys() - set(Ingredient.objects.filter(
+            pk__in=amounts).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                f'Нет ингредиентов с id {sorted(missing)}')
+        return amounts
+
+    def validate_tags(self, value):
+        if not value:
+            raise serializers.ValidationError('Тэги не выбраны')
+        tags = set(value)
+        missing = tags - set(Tag.objects.filter(
+            pk__in=tags).values_list('pk', flat=True))
+        if missing:
+            raise serializers.ValidationError(
+                f'Нет тэгов с id {sorted(missing)}')
+        return tags
+
+    def validate(self, attrs):
+        if self.instance is None:
+            for field in ['ingredients', 'tags']:
+                if field not in attrs:
+                    raise serializers.ValidationError(
+                        {field: 'Обязательное поле.'})
+        return attrs
+
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients = validated_data.pop('ingredients', None)
-        tags = validated_data.pop('tags', None)
-        if not ingredients:
-            raise ValidationError('Ингридиенты не выбраны')
-        if not tags:
-            raise ValidationError('Тэги не выбраны')
+        amounts = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         IngredientToRecipe.objects.bulk_create([
-            IngredientToRecipe(ingredient=ingredient.get('id'),
-                               recipe=recipe, amount=ingredient.get('amount'))
-            for ingredient in ingredients
+            IngredientToRecipe(ingredient_id=ingredient_id, recipe=recipe,
+                               amount=amount)
+            for ingredient_id, amount in amounts.items()
         ])
+        schedule_image_processing(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients', None)
+        amounts = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
-        if ingredients:
-            instance.ingredients.clear()
-            IngredientToRecipe.objects.bulk_create([
-                IngredientToRecipe(ingredient=ingredient.get('id'),
-                                   recipe=instance,
-                                   amount=ingredient.get('amount'))
-                for ingredient in ingredients
-            ])
-        if tags:
+        old_image = instance.image.name
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        # Только изменённые поля: миниатюры могла записать фоновая
+        # обработка. Дата изменения учитывает и состав, и теги
+        instance.save(update_fields=[*validated_data, 'updated'])
+        if amounts is not None:
+            self.update_ingredients(instance, amounts)
+        if tags is not None:
             instance.tags.set(tags)
+        if instance.image.name != old_image:
+            schedule_image_processing(instance)
         return instance
 
+    def update_ingredients(self, recipe, amounts):
+        """Вставляет, меняет и удаляет только отличающиеся строки."""
+        links = {}
+        to_delete = []
+        for link in IngredientToRecipe.objects.filter(recipe=recipe):
+            if link.ingredient_id in links or (
+                    link.ingredient_id not in amounts):
+                to_delete.append(link)
+            else:
+                links[link.ingredient_id] = link
+        # Все изменения состава переносятся в списки покупок одной
+        # дельтой ниже, поэтому ни одна из записей не отправляет сигналов
+        old_amounts = sum_link_amounts([*links.values(), *to_delete])
+        to_update = []
+        for ingredient_id, link in links.items():
+            if link.amount != amounts[ingredient_id]:
+                link.amount = amounts[ingredient_id]
+                to_update.append(link)
+        # _raw_delete — один DELETE без сигналов на каждую строку; на
+        # связи рецепта с ингредиентом ничто не ссылается
+        IngredientToRecipe.objects.filter(
+            pk__in=[link.pk for link in to_delete]
+        )._raw_delete(IngredientToRecipe.objects.db)
+        IngredientToRecipe.objects.bulk_update(to_update, ['amount'])
+        IngredientToRecipe.objects.bulk_create([
+            IngredientToRecipe(ingredient_id=ingredient_id, recipe=recipe,
+                               amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in links
+        ])
+        update_shopping_lists_for_recipe(recipe, old_amounts, amounts)
+
     def to_representation(self, instance):
+        instance = Recipe.objects.with_related().with_user_flags(
+            self.context['request'].user).get(pk=instance.pk)
         serializer = RecipeSerializer(instance, context=self.context)
         return serializer.data
 
@@ -136,21 +255,50 @@ class RecipeSerializer(serializers.ModelSerializer):
     ingredients = IngredientToRecipeSerializer(source='ingredienttorecipe_set',
                                                many=True)
     image = serializers.ImageField(read_only=True)
+    image_webp = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+    thumbnail_webp = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        fields = [
+            'id',
+            'tags',
+            'author',
+            'ingredients',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'name',
+            'image',
+            'image_webp',
+            'thumbnail',
+            'thumbnail_webp',
+            'text',
+            'cooking_time',
+        ]
 
-    def get_is_favorited(self, obj):
+    def get_image_webp(self, obj):
+        return get_image_url(obj.image_webp, self.context)
+
+    def get_thumbnail(self, obj):
+        return get_card_image_url(obj, self.context)
+
+    def get_thumbnail_webp(self, obj):
+        return get_image_url(obj.thumbnail_webp, self.context)
 
+    def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return Favorites.objects.filter(user=user, recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -165,7 +313,7 @@ class FavoritesSerializer(serializers.ModelSerializer):
 
 class SubscribedUserSerializer(UserSerializer):
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     recipes_count = serializers.SerializerMethodField()
 
@@ -191,7 +339,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     first_name = serializers.ReadOnlyField(source='user.first_name')
     last_name = serializers.ReadOnlyField(source='user.last_name')
     is_subscribed = serializers.SerializerMethodField()
-    recipes = RecipeSerializer(many=True, source='user.recipe_set')
+    recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
     class Meta:
@@ -208,16 +356,23 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_subscribed(self, obj):
-        if obj.user.subscriptions.filter(subscriber=obj.user).count():
-            return True
-        else:
-            return False
+        return obj.user_id in get_subscribed_ids(self.context)
+
+    def get_recipes(self, obj):
+        recipes = getattr(obj, 'latest_recipes', None)
+        if recipes is None:
+            recipes = Recipe.objects.latest_for_authors(
+                [obj.user_id], get_recipes_limit(self.context['request']))
+        return ShoppingCartSerializer(recipes, many=True,
+                                      context=self.context).data
 
     def get_recipes_count(self, obj):
-        return obj.user.recipe_set.count()
+        return obj.user.recipes_count
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = [
@@ -226,3 +381,6 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             'image',
             'cooking_time'
         ]
+
+    def get_image(self, obj):
+        return get_card_image_url(obj, self.context)
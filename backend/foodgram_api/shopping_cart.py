@@ -1,24 +1,249 @@
-from .models import ShoppingCartItem, User, IngredientToRecipe, Ingredient
+import csv
+import io
+import logging
+from collections import Counter
+from functools import lru_cache
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
 
-def create_shopping_cart_list(user: User):
-    cart_items = ShoppingCartItem.objects.filter(user=user)
-    cart_dict = {
+from .models import IngredientToRecipe, ShoppingCartItem, ShoppingListItem, \
+    User
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFError, TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
+
+logger = logging.getLogger(__name__)
+
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+def get_shopping_cart_ingredients(user: User):
+    """Список покупок пользователя из материализованной таблицы.
+
+    Возвращает строки (name, measurement_unit, amount),
+    отсортированные по названию и единице измерения.
+    """
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+    ).order_by(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    )
+
+
+def calculate_shopping_lists(user_ids=None):
+    """Списки покупок, посчитанные заново по корзинам одним запросом.
+
+    Возвращает словарь {(user_id, ingredient_id): amount}.
+    """
+    # Один filter(): второй вызов по связи многие-ко-многим добавил бы
+    # ещё один JOIN корзины и чужие корзины попали бы в сумму
+    lookups = {'recipe__shoppingcartitem__isnull': False}
+    if user_ids is not None:
+        lookups['recipe__shoppingcartitem__user__in'] = user_ids
+    rows = IngredientToRecipe.objects.filter(**lookups).values_list(
+        'recipe__shoppingcartitem__user',
+        'ingredient',
+    ).annotate(
+        total=Sum('amount')
+    ).order_by()
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in rows
+    }
+
+
+def get_recipe_ingredient_amounts(recipe):
+    amounts = Counter()
+    for ingredient_id, amount in IngredientToRecipe.objects.filter(
+            recipe=recipe).values_list('ingredient_id', 'amount'):
+        amounts[ingredient_id] += amount
+    return amounts
 
+
+def sum_link_amounts(links):
+    """То же, что get_recipe_ingredient_amounts, по уже загруженным связям."""
+    amounts = Counter()
+    for link in links:
+        amounts[link.ingredient_id] += link.amount
+    return amounts
+
+
+def negate(amounts):
+    return {
+        ingredient_id: -amount for ingredient_id, amount in amounts.items()
+    }
+
+
+def apply_shopping_list_delta(user_ids, delta):
+    """Прибавляет delta {ingredient_id: изменение} к спискам покупок.
+
+    Строки, количество в которых стало нулевым, удаляются.
+    """
+    delta = {
+        ingredient_id: change
+        for ingredient_id, change in delta.items() if change
     }
-    for item in cart_items:
-        recipe = item.recipe
-        for ingredient in recipe.ingredients.all():
-            if ingredient.id in cart_dict.keys():
-                cart_dict[ingredient.id] += IngredientToRecipe.objects.get(
-                    recipe=recipe, ingredient=ingredient).amount
-            else:
-                cart_dict[ingredient.id] = IngredientToRecipe.objects.get(
-                    recipe=recipe, ingredient=ingredient).amount
-    output = []
-    for ingredient_id, amount in cart_dict.items():
-        ingredient = Ingredient.objects.get(id=ingredient_id)
-        output.append(
-            f'{ingredient.name} - {amount} {ingredient.measurement_unit}'
-        )
-    return '\n'.join(output).encode('utf-8')
+    if not delta or not user_ids:
+        return
+    with transaction.atomic():
+        # Блокируем пользователей, чтобы параллельные изменения корзины
+        # не вставили одну и ту же строку дважды.
+        user_ids = list(User.objects.select_for_update().filter(
+            pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+        existing = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(
+                user_id__in=user_ids, ingredient_id__in=delta)
+        }
+        to_create, to_update, to_delete = [], [], []
+        for user_id in user_ids:
+            for ingredient_id, change in delta.items():
+                item = existing.get((user_id, ingredient_id))
+                if item is None:
+                    if change > 0:
+                        to_create.append(ShoppingListItem(
+                            user_id=user_id, ingredient_id=ingredient_id,
+                            amount=change
+                        ))
+                    continue
+                item.amount += change
+                if item.amount > 0:
+                    to_update.append(item)
+                else:
+                    to_delete.append(item.pk)
+        ShoppingListItem.objects.bulk_create(to_create)
+        ShoppingListItem.objects.bulk_update(to_update, ['amount'])
+        ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def get_cart_user_ids(recipe):
+    return list(ShoppingCartItem.objects.filter(
+        recipe=recipe).values_list('user_id', flat=True))
+
+
+def change_recipe_in_shopping_list(user_id, recipe_id, sign):
+    """Добавляет (sign=1) или убирает (sign=-1) рецепт из списка покупок.
+
+    Состав рецепта читается из базы.
+    """
+    amounts = get_recipe_ingredient_amounts(recipe_id)
+    apply_shopping_list_delta(
+        [user_id], amounts if sign > 0 else negate(amounts))
+
+
+def change_ingredient_in_shopping_lists(recipe_id, ingredient_id, amount):
+    """Меняет количество ингредиента у всех, чья корзина с рецептом."""
+    apply_shopping_list_delta(get_cart_user_ids(recipe_id),
+                              {ingredient_id: amount})
+
+
+def update_shopping_lists_for_recipe(recipe, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки покупок.
+
+    Нужна только для bulk_create и bulk_update, которые не отправляют
+    сигналов; остальные изменения учитывает signals.py.
+    """
+    delta = Counter(new_amounts)
+    delta.subtract(old_amounts)
+    apply_shopping_list_delta(get_cart_user_ids(recipe), delta)
+
+
+def iter_txt(rows):
+    for name, measurement_unit, amount in rows:
+        yield f'{name} - {amount} {measurement_unit}\n'.encode('utf-8')
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['name', 'measurement_unit', 'amount']).encode(
+        'utf-8')
+    for row in rows:
+        yield writer.writerow(row).encode('utf-8')
+
+
+@lru_cache(maxsize=None)
+def register_pdf_font(path):
+    try:
+        pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, path))
+    except TTFError as error:
+        logger.error('Выгрузка в PDF недоступна: шрифт %s: %s', path, error)
+        return False
+    return True
+
+
+def pdf_available():
+    """Установлен ли reportlab и читается ли шрифт для PDF.
+
+    Проверяется до выбора формата: ошибка шрифта внутри iter_pdf
+    оборвала бы уже начатый ответ 200.
+    """
+    return canvas is not None and register_pdf_font(
+        settings.SHOPPING_CART_PDF_FONT)
+
+
+def iter_pdf(rows):
+    """PDF собирается постранично и отдаётся частями по PDF_CHUNK_SIZE.
+
+    reportlab пишет таблицу ссылок в конце документа, поэтому первые
+    байты уходят клиенту только после сборки всего файла. Шрифт
+    регистрирует pdf_available.
+    """
+    buffer = io.BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    line_height = PDF_FONT_SIZE * 1.5
+    y = height - PDF_MARGIN
+    document.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+    for name, measurement_unit, amount in rows:
+        if y < PDF_MARGIN:
+            document.showPage()
+            document.setFont(PDF_FONT_NAME, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        document.drawString(PDF_MARGIN, y,
+                            f'{name} - {amount} {measurement_unit}')
+        y -= line_height
+    document.save()
+    buffer.seek(0)
+    while True:
+        chunk = buffer.read(PDF_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+EXPORT_FORMATS = {
+    'txt': iter_txt,
+    'csv': iter_csv,
+    'pdf': iter_pdf,
+}
+
+
+def iter_shopping_cart_list(user: User, export_format='txt'):
+    rows = get_shopping_cart_ingredients(user).iterator()
+    return EXPORT_FORMATS[export_format](rows)
+
+
+def create_shopping_cart_list(user: User):
+    return b''.join(iter_shopping_cart_list(user))
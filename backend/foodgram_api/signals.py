@@ -0,0 +1,142 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import evict_tokens, evict_user_tokens
+from .catalog import INGREDIENTS, TAGS, bump_catalog_version
+from .counters import COUNTERS, change_counter
+from .models import Favorites, Ingredient, IngredientToRecipe, Recipe, \
+    ShoppingCartItem, Subscription, Tag, User
+from .shopping_cart import change_ingredient_in_shopping_lists, \
+    change_recipe_in_shopping_list
+
+# Поля, при изменении которых post_save пересчитывает производные данные
+TRACKED_FIELDS = {
+    IngredientToRecipe: ['recipe', 'ingredient', 'amount'],
+    ShoppingCartItem: ['user', 'recipe'],
+    Favorites: ['recipe'],
+    Subscription: ['user'],
+    Recipe: ['author'],
+}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_catalog_version(INGREDIENTS)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_catalog_version(TAGS)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    evict_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, **kwargs):
+    # Смена пароля, деактивация и правка профиля сбрасывают
+    # закэшированного пользователя
+    if not created:
+        evict_user_tokens(instance)
+
+
+@receiver(pre_save, sender=IngredientToRecipe)
+@receiver(pre_save, sender=ShoppingCartItem)
+@receiver(pre_save, sender=Favorites)
+@receiver(pre_save, sender=Subscription)
+@receiver(pre_save, sender=Recipe)
+def remember_previous(sender, instance, raw, update_fields, **kwargs):
+    """Запоминает прежние значения отслеживаемых полей для post_save."""
+    attnames = [sender._meta.get_field(name).attname
+                for name in TRACKED_FIELDS[sender]]
+    instance.previous = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not (
+            {*TRACKED_FIELDS[sender], *attnames} & set(update_fields)):
+        return
+    instance.previous = sender.objects.filter(pk=instance.pk).values(
+        *attnames).first()
+
+
+# Списки покупок правятся сигналами, чтобы их учитывали и админка,
+# и каскадное удаление. При удалении рецепта или пользователя связи
+# и корзины удаляются раньше рецепта, в любом порядке: post_delete
+# читает вторую сторону из базы, поэтому пары «корзина — ингредиент»
+# вычитаются ровно один раз.
+
+@receiver(post_save, sender=IngredientToRecipe)
+def recipe_ingredient_saved(sender, instance, created, raw, **kwargs):
+    previous = getattr(instance, 'previous', None)
+    if raw or not (created or previous):
+        return
+    if previous:
+        change_ingredient_in_shopping_lists(
+            previous['recipe_id'], previous['ingredient_id'],
+            -previous['amount'])
+    change_ingredient_in_shopping_lists(
+        instance.recipe_id, instance.ingredient_id, instance.amount)
+
+
+@receiver(post_delete, sender=IngredientToRecipe)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    change_ingredient_in_shopping_lists(
+        instance.recipe_id, instance.ingredient_id, -instance.amount)
+
+
+@receiver(post_save, sender=ShoppingCartItem)
+def cart_item_saved(sender, instance, created, raw, **kwargs):
+    previous = getattr(instance, 'previous', None)
+    if raw or not (created or previous):
+        return
+    if previous:
+        change_recipe_in_shopping_list(
+            previous['user_id'], previous['recipe_id'], -1)
+    change_recipe_in_shopping_list(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=ShoppingCartItem)
+def cart_item_deleted(sender, instance, **kwargs):
+    change_recipe_in_shopping_list(instance.user_id, instance.recipe_id, -1)
+
+
+# Счётчики тоже правятся сигналами: их меняют и API, и админка,
+# и каскадное удаление пользователя или рецепта. bulk_create и
+# bulk_update сигналов не отправляют, такие пути увеличивают
+# счётчики сами или вызывают reconcile_counters.
+
+def get_counters(sender):
+    for model, field, related_model, foreign_key in COUNTERS:
+        if related_model is sender:
+            yield model, field, sender._meta.get_field(foreign_key).attname
+
+
+@receiver(post_save, sender=Favorites)
+@receiver(post_save, sender=ShoppingCartItem)
+@receiver(post_save, sender=Subscription)
+@receiver(post_save, sender=Recipe)
+def counted_saved(sender, instance, created, raw, **kwargs):
+    previous = getattr(instance, 'previous', None)
+    if raw or not (created or previous):
+        return
+    for model, field, attname in get_counters(sender):
+        pk = getattr(instance, attname)
+        if created:
+            change_counter(model, pk, field, 1)
+        elif previous[attname] != pk:
+            change_counter(model, previous[attname], field, -1)
+            change_counter(model, pk, field, 1)
+
+
+@receiver(post_delete, sender=Favorites)
+@receiver(post_delete, sender=ShoppingCartItem)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=Recipe)
+def counted_deleted(sender, instance, **kwargs):
+    for model, field, attname in get_counters(sender):
+        change_counter(model, getattr(instance, attname), field, -1)
@@ -0,0 +1,52 @@
+import hashlib
+import os
+from uuid import uuid4
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+CONTENT_DIR = 'images'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хэш его содержимого.
+
+    Одинаковые файлы сохраняются один раз, а файл под данным именем
+    никогда не меняется, поэтому его можно кэшировать навсегда.
+    Файлы, на которые больше нет ссылок, удаляет команда collect_media.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return f'{CONTENT_DIR}/{digest[:2]}/{digest}{extension}'
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Занятое имя означает то же самое содержимое
+        return name
+
+    def _save(self, name, content):
+        try:
+            # Файл снова в ходу: свежее время изменения не даст
+            # collect_media удалить его до коммита новой ссылки
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            pass
+        # Пишем во временный файл и переименовываем, чтобы параллельный
+        # запрос не увидел файл записанным наполовину
+        temporary = super()._save(f'{name}.{uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
@@ -1,3 +1,1753 @@
-from django.test import TestCase
+import json
+import os
+from base64 import b64encode
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from .authentication import LRUCache, token_cache
+from .catalog import INGREDIENTS
+from .counters import reconcile_counters
+from .models import CatalogVersion, Favorites, Ingredient, \
+    IngredientToRecipe, Recipe, ShoppingCartItem, ShoppingListItem, \
+    Subscription, Tag, User
+from .shopping_cart import create_shopping_cart_list, \
+    get_shopping_cart_ingredients, pdf_available
+from .storage import ContentAddressedStorage
+from .throttling import LoginEmailThrottle, LoginIPThrottle, get_stats
+
+load_ingredient = import_module(
+    'foodgram_api.management.commands.load_ingredient')
+
+
+class ShoppingCartTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_recipes_to_cart(self, count):
+        recipes = []
+        for index in range(count):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'рецепт {index}', image='recipe.png',
+                text='описание', cooking_time=10
+            )
+            IngredientToRecipe.objects.bulk_create([
+                IngredientToRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=10)
+                for ingredient in self.ingredients
+            ])
+            response = self.client.post(
+                f'/api/recipes/{recipe.id}/shopping_cart/')
+            self.assertEqual(response.status_code, 201)
+            recipes.append(recipe)
+        return recipes
+
+    def get_shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user).values_list('ingredient__name', 'amount'))
+
+    def test_ingredients_are_summed(self):
+        self.add_recipes_to_cart(3)
+        rows = list(get_shopping_cart_ingredients(self.user))
+        self.assertEqual(rows, [
+            (ingredient.name, 'г', 30) for ingredient in self.ingredients
+        ])
+        self.assertEqual(
+            create_shopping_cart_list(self.user).decode('utf-8').splitlines(),
+            [f'{ingredient.name} - 30 г' for ingredient in self.ingredients]
+        )
+
+    def test_shopping_list_follows_cart(self):
+        first, second = self.add_recipes_to_cart(2)
+        IngredientToRecipe.objects.filter(
+            recipe=second, ingredient=self.ingredients[0]).update(amount=15)
+        response = self.client.delete(
+            f'/api/recipes/{first.id}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        shopping_list = self.get_shopping_list()
+        self.assertEqual(shopping_list['ингредиент 0'], 10)
+        self.assertEqual(shopping_list['ингредиент 1'], 10)
+
+        self.client.delete(f'/api/recipes/{second.id}/shopping_cart/')
+        self.assertEqual(self.get_shopping_list(), {})
+
+    def test_shopping_list_follows_recipe_update(self):
+        recipe, = self.add_recipes_to_cart(1)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            data={'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 25},
+                {'id': self.ingredients[1].id, 'amount': 5},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_shopping_list(),
+                         {'ингредиент 0': 25, 'ингредиент 1': 5})
+
+        self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(self.get_shopping_list(), {})
+
+    def test_shopping_list_follows_model_changes(self):
+        # Админка и каскадное удаление идут мимо API
+        first, second = self.add_recipes_to_cart(2)
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='password')
+        ShoppingCartItem.objects.create(user=other, recipe=first)
+        link = IngredientToRecipe.objects.get(
+            recipe=first, ingredient=self.ingredients[0])
+        link.amount = 40
+        link.save()
+        link.ingredient = Ingredient.objects.create(name='новый',
+                                                    measurement_unit='г')
+        link.save()
+        IngredientToRecipe.objects.get(
+            recipe=first, ingredient=self.ingredients[1]).delete()
+        IngredientToRecipe.objects.create(
+            recipe=first, ingredient=self.ingredients[1], amount=7)
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+        self.assertEqual(self.get_shopping_list()['новый'], 40)
+        first.delete()
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+        self.assertFalse(ShoppingListItem.objects.filter(user=other).exists())
+        ShoppingCartItem.objects.create(user=other, recipe=second)
+        own = Recipe.objects.create(
+            author=other, name='свой', image='recipe.png', text='описание',
+            cooking_time=10)
+        IngredientToRecipe.objects.create(
+            recipe=own, ingredient=self.ingredients[0], amount=3)
+        ShoppingCartItem.objects.create(user=self.user, recipe=own)
+        ShoppingCartItem.objects.create(user=other, recipe=own)
+        self.user.delete()
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+        self.assertEqual(self.get_shopping_list(), {})
+        self.assertEqual(ShoppingListItem.objects.get(
+            user=other, ingredient=self.ingredients[0]).amount, 3)
+
+    def test_rebuild_command(self):
+        self.add_recipes_to_cart(2)
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+        ShoppingListItem.objects.filter(
+            ingredient=self.ingredients[0]).delete()
+        ShoppingListItem.objects.filter(
+            ingredient=self.ingredients[1]).update(amount=1)
+        ShoppingListItem.objects.create(
+            user=self.user, ingredient=Ingredient.objects.create(
+                name='лишний', measurement_unit='г'), amount=1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_shopping_lists', '--check',
+                         stdout=StringIO())
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(self.get_shopping_list(), {
+            ingredient.name: 20 for ingredient in self.ingredients
+        })
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.add_recipes_to_cart(1)
+        with self.assertNumQueries(1):
+            create_shopping_cart_list(self.user)
+        self.add_recipes_to_cart(30)
+        with self.assertNumQueries(1):
+            create_shopping_cart_list(self.user)
+
+    def download(self, export_format=None):
+        url = '/api/recipes/download_shopping_cart/'
+        if export_format:
+            url = f'{url}?format={export_format}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response
+
+    def test_download(self):
+        self.add_recipes_to_cart(2)
+        response = self.download()
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn('user.txt', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertIn('ингредиент 0 - 20 г', content)
+
+    def test_download_csv(self):
+        self.add_recipes_to_cart(2)
+        response = self.download('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(content.splitlines()[:2], [
+            'name,measurement_unit,amount',
+            'ингредиент 0,г,20',
+        ])
+
+    @skipUnless(pdf_available(), 'reportlab не установлен')
+    def test_download_pdf(self):
+        self.add_recipes_to_cart(2)
+        response = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(
+            b''.join(response.streaming_content).startswith(b'%PDF'))
+
+    @skipUnless(pdf_available(), 'reportlab не установлен')
+    def test_download_pdf_without_font(self):
+        self.add_recipes_to_cart(1)
+        with override_settings(SHOPPING_CART_PDF_FONT='/nonexistent.ttf'), \
+                self.assertLogs('foodgram_api.shopping_cart', 'ERROR'):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/?format=pdf')
+            self.assertEqual(response.status_code, 404)
+            self.download('txt')
+
+    def test_download_unknown_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=xml')
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'тег {index}', color='#000000',
+                               slug=f'tag{index}')
+            for index in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(3)
+        ]
+        cls.recipes = cls.create_recipes(3)
+        Favorites.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingCartItem.objects.create(user=cls.user, recipe=cls.recipes[1])
+
+    @classmethod
+    def create_recipes(cls, count):
+        authors = [
+            User.objects.create_user(
+                email=f'author{index}@example.com', username=f'author{index}',
+                password='password'
+            )
+            for index in range(User.objects.count(),
+                               User.objects.count() + count)
+        ]
+        recipes = []
+        for author in authors:
+            recipe = Recipe.objects.create(
+                author=author, name=f'рецепт {author.id}', image='recipe.png',
+                text='описание', cooking_time=10
+            )
+            recipe.tags.set(cls.tags)
+            IngredientToRecipe.objects.bulk_create([
+                IngredientToRecipe(recipe=recipe, ingredient=ingredient,
+                                   amount=10)
+                for ingredient in cls.ingredients
+            ])
+            recipes.append(recipe)
+        return recipes
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_results(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return {
+            recipe['id']: (recipe['is_favorited'],
+                           recipe['is_in_shopping_cart'])
+            for recipe in response.data['results']
+        }
+
+    def test_user_flags(self):
+        first, second, third = self.recipes
+        self.assertEqual(self.get_results('/api/recipes/'), {
+            first.id: (True, False),
+            second.id: (False, True),
+            third.id: (False, False),
+        })
+
+    def test_user_flags_for_anonymous(self):
+        self.client.force_authenticate(None)
+        results = self.get_results('/api/recipes/?is_favorited=1')
+        self.assertEqual(len(results), 3)
+        self.assertEqual(set(results.values()), {(False, False)})
+
+    def test_filter_by_user_flags(self):
+        first, second, _ = self.recipes
+        self.assertEqual(
+            list(self.get_results('/api/recipes/?is_favorited=1')),
+            [first.id]
+        )
+        self.assertEqual(
+            list(self.get_results('/api/recipes/?is_in_shopping_cart=1')),
+            [second.id]
+        )
+
+    def test_filter_by_tags(self):
+        untagged = self.create_recipes(1)[0]
+        untagged.tags.clear()
+        results = self.get_results(
+            f'/api/recipes/?tags={self.tags[0].slug}&tags={self.tags[1].slug}')
+        self.assertEqual(set(results),
+                         {recipe.id for recipe in self.recipes})
+
+    def test_list_query_budget(self):
+        # count, рецепты с автором и флагами, теги, ингредиенты, подписки
+        with self.assertNumQueries(5):
+            self.client.get('/api/recipes/')
+        self.create_recipes(10)
+        with self.assertNumQueries(5):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.data['count'], 13)
+        recipe = response.data['results'][0]
+        self.assertEqual(len(recipe['tags']), 2)
+        self.assertEqual(len(recipe['ingredients']), 3)
+
+    def test_search_vector_not_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/recipes/')
+        self.assertFalse(any('search_vector' in query['sql']
+                             for query in queries.captured_queries))
+
+    def test_author_is_subscribed(self):
+        Subscription.objects.create(user=self.recipes[0].author,
+                                    subscriber=self.user)
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(
+            {
+                recipe['author']['id']: recipe['author']['is_subscribed']
+                for recipe in response.data['results']
+            },
+            {
+                recipe.author_id: recipe == self.recipes[0]
+                for recipe in self.recipes
+            }
+        )
+
+    def test_list_query_budget_for_anonymous(self):
+        self.client.force_authenticate(None)
+        self.create_recipes(10)
+        with self.assertNumQueries(4):
+            self.client.get('/api/recipes/')
+
+    def test_retrieve_query_budget(self):
+        # ETag (рецепт и отметки пользователя), версии справочников,
+        # рецепт с автором, теги, ингредиенты, подписки
+        with self.assertNumQueries(6):
+            response = self.client.get(f'/api/recipes/{self.recipes[0].id}/')
+        self.assertEqual(response.data['author']['id'],
+                         self.recipes[0].author_id)
+
+
+class UserTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                email=f'author{index}@example.com', username=f'author{index}',
+                password='password'
+            )
+            for index in range(10)
+        ]
+        Subscription.objects.bulk_create([
+            Subscription(user=author, subscriber=cls.user)
+            for author in cls.authors[:5]
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_is_subscribed(self):
+        # count, пользователи, подписки
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/users/')
+        self.assertEqual(
+            {user['id']: user['is_subscribed']
+             for user in response.data['results']},
+            {
+                user.id: user in self.authors[:5]
+                for user in [self.user, *self.authors]
+            }
+        )
+
+    def test_retrieve_is_subscribed(self):
+        response = self.client.get(f'/api/users/{self.authors[0].id}/')
+        self.assertTrue(response.data['is_subscribed'])
+        response = self.client.get(f'/api/users/{self.authors[-1].id}/')
+        self.assertFalse(response.data['is_subscribed'])
+
+    def test_me(self):
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['is_subscribed'])
+
+    def test_subscriptions_are_subscribed(self):
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.data['count'], 5)
+        self.assertTrue(all(
+            user['is_subscribed'] for user in response.data['results']))
+
+
+class SubscriptionListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.authors = [cls.add_author(recipes=index + 2)
+                       for index in range(3)]
+
+    @classmethod
+    def add_author(cls, recipes):
+        index = User.objects.count()
+        author = User.objects.create_user(
+            email=f'author{index}@example.com',
+            username=f'author{index}', password='password'
+        )
+        for index in range(recipes):
+            Recipe.objects.create(
+                author=author, name=f'рецепт {index}', image='recipe.png',
+                text='описание', cooking_time=10
+            )
+        Subscription.objects.create(user=author, subscriber=cls.user)
+        return author
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_limit(self):
+        # Рецепт с меньшим id, но позже созданный (например, импортом
+        # с датой) — новее: порядок как в ленте, по created
+        for author in self.authors:
+            oldest = author.recipe_set.order_by('id').first()
+            Recipe.objects.filter(pk=oldest.pk).update(
+                created=oldest.created + timedelta(days=1))
+        response = self.client.get('/api/users/subscriptions/'
+                                   '?recipes_limit=2')
+        for author, data in zip(self.authors, response.data['results']):
+            newest = list(author.recipe_set.order_by(
+                '-created', '-id').values_list('id', flat=True)[:2])
+            self.assertEqual(newest[0],
+                             author.recipe_set.order_by('id').first().id)
+            self.assertEqual(data['id'], author.id)
+            self.assertEqual([recipe['id'] for recipe in data['recipes']],
+                             newest)
+            self.assertEqual(data['recipes_count'],
+                             author.recipe_set.count())
+
+    def test_without_recipes_limit(self):
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(
+            [len(data['recipes']) for data in response.data['results']],
+            [2, 3, 4]
+        )
+
+    def test_no_subscriptions(self):
+        self.client.force_authenticate(self.authors[0])
+        response = self.client.get('/api/users/subscriptions/'
+                                   '?recipes_limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_query_budget(self):
+        # count, подписки с числом рецептов, рецепты, id подписок
+        with self.assertNumQueries(4):
+            self.client.get('/api/users/subscriptions/?recipes_limit=3')
+        for _ in range(5):
+            self.add_author(recipes=5)
+        with self.assertNumQueries(4):
+            self.client.get('/api/users/subscriptions/?recipes_limit=3')
+
+    def test_subscribe_response(self):
+        author = User.objects.create_user(
+            email='new@example.com', username='new', password='password')
+        for index in range(3):
+            Recipe.objects.create(
+                author=author, name=f'рецепт {index}', image='recipe.png',
+                text='описание', cooking_time=10
+            )
+        reconcile_counters()
+        response = self.client.post(
+            f'/api/users/{author.id}/subscribe/?recipes_limit=1')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['recipes']), 1)
+        self.assertEqual(response.data['recipes_count'], 3)
+        self.assertTrue(response.data['is_subscribed'])
+
+
+class IngredientSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ['сыр', 'сырок', 'соль', 'творожный сыр', 'абрикос']:
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'сырники {index}', measurement_unit='шт')
+            for index in range(30)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, name):
+        response = self.client.get(f'/api/ingredients/?name={name}')
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(self.search('СЫР')[:2], ['сыр', 'сырники 0'])
+        self.assertEqual(self.search('ор'), ['творожный сыр'])
+        self.assertEqual(self.search('брик'), ['абрикос'])
+
+    def test_limit(self):
+        results = self.search('сыр')
+        self.assertEqual(len(results), 20)
+        self.assertNotIn('творожный сыр', results)
+        self.assertEqual(len(self.search('ы')), 20)
+
+    def test_without_name_returns_all(self):
+        response = self.client.get('/api/ingredients/')
+        self.assertEqual(len(response.json()), 35)
+
+    def test_index_is_refreshed(self):
+        self.assertEqual(self.search('абр'), ['абрикос'])
+        with self.assertNumQueries(0):
+            self.search('абр')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='абрикосовый джем',
+                                      measurement_unit='г')
+        self.assertEqual(self.search('абр'), ['абрикос', 'абрикосовый джем'])
+
+    @override_settings(INGREDIENT_SEARCH_INDEX=False)
+    def test_database_fallback(self):
+        self.assertEqual(self.search('сыр')[:2], ['сыр', 'сырники 0'])
+        self.assertEqual(self.search('ор'), ['творожный сыр'])
+        self.assertEqual(len(self.search('сыр')), 20)
+
+
+class CatalogCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='завтрак', color='#000000',
+                                     slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rendered_once_per_version(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['slug'], 'breakfast')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/tags/')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+    def test_not_modified(self):
+        for url in ['/api/tags/', f'/api/tags/{self.tag.id}/',
+                    '/api/ingredients/', '/api/ingredients/?name=со']:
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_version_bumped_on_change(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'обед'
+            self.tag.save()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['name'], 'обед')
+
+    def test_load_ingredient_bumps_version(self):
+        etag = self.client.get('/api/ingredients/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_ingredient', stdout=StringIO())
+        response = self.client.get('/api/ingredients/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), Ingredient.objects.count())
+
+    @override_settings(CATALOG_VERSION_TTL=0)
+    def test_version_shared_between_processes(self):
+        # Другой процесс (load_ingredient через docker-compose exec)
+        # меняет только строку в базе, до кэша этого процесса он
+        # не дотягивается
+        etag = self.client.get('/api/ingredients/')['ETag']
+        self.assertEqual(self.client.get('/api/ingredients/?name=пер').json(),
+                         [])
+        Ingredient.objects.bulk_create([
+            Ingredient(name='перец', measurement_unit='г')])
+        CatalogVersion.objects.update_or_create(
+            name=INGREDIENTS, defaults={'version': 'other-process'})
+        response = self.client.get('/api/ingredients/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(
+            [item['name'] for item in self.client.get(
+                '/api/ingredients/?name=пер').json()],
+            ['перец']
+        )
+
+    def test_missing_detail(self):
+        response = self.client.get('/api/tags/0/')
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='рецепт', image='recipe.png',
+            text='описание', cooking_time=10
+        )
+        IngredientToRecipe.objects.create(recipe=cls.recipe,
+                                          ingredient=cls.ingredient, amount=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.detail_url = f'/api/recipes/{self.recipe.id}/'
+        self.list_url = '/api/recipes/?cursor='
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_not_modified(self):
+        for url, queries in [(self.detail_url, 1), (self.list_url, 2)]:
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(queries):
+                self.assertEqual(self.revalidate(url, etag), 304)
+
+    def test_recipe_update(self):
+        etags = [self.client.get(url)['ETag']
+                 for url in [self.detail_url, self.list_url]]
+        response = self.client.patch(
+            self.detail_url,
+            data={'ingredients': [{'id': self.ingredient.id, 'amount': 2}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.revalidate(self.detail_url, etags[0]), 200)
+        self.assertEqual(self.revalidate(self.list_url, etags[1]), 200)
+
+    def test_viewer_state(self):
+        etags = [self.client.get(url)['ETag']
+                 for url in [self.detail_url, self.list_url]]
+        self.client.post(f'{self.detail_url}favorite/')
+        self.assertEqual(self.revalidate(self.detail_url, etags[0]), 200)
+        self.assertEqual(self.revalidate(self.list_url, etags[1]), 200)
+
+    def test_author_profile(self):
+        # Профиль автора выводится в рецепте, но не меняет дату рецепта
+        etags = [self.client.get(url)['ETag']
+                 for url in [self.detail_url, self.list_url]]
+        self.user.first_name = 'Новое имя'
+        self.user.save()
+        for url, etag in zip([self.detail_url, self.list_url], etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Новое имя')
+
+    def test_list_filters(self):
+        url = f'{self.list_url}&author={self.user.id}'
+        etag = self.client.get(url)['ETag']
+        Recipe.objects.create(
+            author=User.objects.create_user(
+                email='author@example.com', username='author',
+                password='password'),
+            name='другой', image='recipe.png', text='описание',
+            cooking_time=1
+        )
+        self.assertEqual(self.revalidate(url, etag), 304)
+        self.assertEqual(self.revalidate(self.list_url, etag), 200)
+
+    def test_page_mode_not_conditional(self):
+        # Валидатор страницы ?page= потребовал бы агрегата по всей выборке
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.get('ETag'))
+
+    def test_last_modified_for_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.detail_url)
+        response = self.client.get(
+            self.detail_url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_recipe(self):
+        self.assertEqual(self.client.get('/api/recipes/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/recipes/abc/').status_code,
+                         404)
+
+
+class RecipePaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user, name=f'рецепт {index}', image='recipe.png',
+                text='описание', cooking_time=10
+            )
+            for index in range(7)
+        ]
+        # Одинаковое время создания у части рецептов, как после миграции
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in cls.recipes[2:5]]
+        ).update(created=cls.recipes[2].created)
+        cls.expected = list(Recipe.objects.order_by(
+            '-created', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def get_ids(self, response):
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_page_number_with_limit(self):
+        response = self.client.get('/api/recipes/?page=2&limit=3')
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(self.get_ids(response), self.expected[3:6])
+
+    def test_cursor_forward_and_back(self):
+        ids = []
+        pages = []
+        url = '/api/recipes/?cursor=&limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            pages.append(response)
+            ids += self.get_ids(response)
+            url = response.data['next']
+        self.assertEqual(ids, self.expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0].data['previous'])
+
+        response = self.client.get(pages[2].data['previous'])
+        self.assertEqual(self.get_ids(response), self.expected[3:6])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.get_ids(response), self.expected[:3])
+        self.assertIsNone(response.data['previous'])
+
+    def test_cursor_does_not_count(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/recipes/?cursor=&limit=3')
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT COUNT(*)')
+            for query in queries
+        ))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=broken')
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = [
+            User.objects.create_user(
+                email=f'{username}@example.com', username=username,
+                password='password'
+            )
+            for username in ['user', 'other']
+        ]
+        cls.in_text = Recipe.objects.create(
+            author=cls.user, name='завтрак', image='recipe.png',
+            text='омлет с сыром', cooking_time=10
+        )
+        cls.in_name = Recipe.objects.create(
+            author=cls.user, name='сырники', image='recipe.png',
+            text='творог, мука', cooking_time=10
+        )
+        cls.other_author = Recipe.objects.create(
+            author=cls.other, name='сырный суп', image='recipe.png',
+            text='суп', cooking_time=10
+        )
+        Recipe.objects.create(
+            author=cls.user, name='борщ', image='recipe.png',
+            text='свёкла', cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get(f'/api/recipes/?search={query}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(
+            self.search('сыр'),
+            [self.other_author.id, self.in_name.id, self.in_text.id]
+        )
+
+    def test_combined_with_filters(self):
+        self.assertEqual(
+            self.search(f'сыр&author={self.user.id}'),
+            [self.in_name.id, self.in_text.id]
+        )
+
+
+def make_image_base64(size, mode='RGB'):
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + b64encode(buffer.getvalue()).decode('ascii'))
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False,
+                   RECIPE_THUMBNAIL_SIZE=(60, 40))
+class RecipeImageTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.tag = Tag.objects.create(name='завтрак', color='#FFFFFF',
+                                     slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, mode='RGB'):
+        return self.client.post('/api/recipes/', data={
+            'image': make_image_base64((300, 100), mode),
+            'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+            'tags': [self.tag.id],
+            'name': 'рецепт',
+            'text': 'описание',
+            'cooking_time': 10,
+        }, format='json')
+
+    def test_variants_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.create_recipe()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(callbacks), 1)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        with Image.open(recipe.thumbnail) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size),
+                             ('JPEG', (60, 40)))
+        with Image.open(recipe.thumbnail_webp) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size),
+                             ('WEBP', (60, 40)))
+        with Image.open(recipe.image_webp) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (300, 100)))
+
+        card = self.client.get('/api/recipes/').data['results'][0]
+        self.assertTrue(card['thumbnail'].endswith(recipe.thumbnail.url))
+        self.assertTrue(card['image'].endswith(recipe.image.url))
+        cart = self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.assertEqual(cart.status_code, 201)
+        self.assertTrue(cart.data['image'].endswith(recipe.thumbnail.url))
+
+    def test_transparent_thumbnail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe(mode='RGBA')
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        with Image.open(recipe.thumbnail) as thumbnail:
+            self.assertEqual(thumbnail.format, 'PNG')
+
+    def test_original_until_processed(self):
+        response = self.create_recipe()
+        self.assertEqual(response.data['thumbnail'], response.data['image'])
+        self.assertIsNone(response.data['thumbnail_webp'])
+        self.assertNotIn('search_vector', response.data)
+
+        out = StringIO()
+        call_command('process_images', stdout=out)
+        self.assertIn('Обработано картинок: 1', out.getvalue())
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertTrue(recipe.thumbnail)
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(
+            response.data['thumbnail'].endswith(recipe.thumbnail.url))
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.storage = ContentAddressedStorage(location=media_root.name)
+
+    def test_same_content_saved_once(self):
+        first = self.storage.save('a.PNG', ContentFile(b'picture'))
+        second = self.storage.save('b.png', ContentFile(b'picture'))
+        other = self.storage.save('c.png', ContentFile(b'other picture'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^images/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.storage.listdir(first.rsplit('/', 1)[0]),
+                         ([], [first.rsplit('/', 1)[1]]))
+        with self.storage.open(first) as file:
+            self.assertEqual(file.read(), b'picture')
+
+    def test_reuse_touches_file(self):
+        name = self.storage.save('a.png', ContentFile(b'picture'))
+        os.utime(self.storage.path(name), (0, 0))
+        self.storage.save('b.png', ContentFile(b'picture'))
+        self.assertGreater(os.path.getmtime(self.storage.path(name)), 0)
+
+
+class CollectMediaTest(TestCase):
+    def setUp(self):
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        self.used = default_storage.save('used.png', ContentFile(b'used'))
+        self.unused = default_storage.save('unused.png',
+                                           ContentFile(b'unused'))
+        Recipe.objects.create(author=user, name='рецепт', image=self.used,
+                              text='описание', cooking_time=10)
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_unreferenced_removed(self):
+        self.assertIn('Файлов без ссылок: 1', self.collect('--grace=0'))
+        self.assertTrue(default_storage.exists(self.used))
+        self.assertFalse(default_storage.exists(self.unused))
+
+    def test_only_content_directory(self):
+        os.makedirs(default_storage.path('recipes'))
+        for name in ['.gitkeep', 'recipes/old.png']:
+            open(default_storage.path(name), 'wb').close()
+        self.assertIn('Файлов без ссылок: 1', self.collect('--grace=0'))
+        self.assertTrue(default_storage.exists('.gitkeep'))
+        self.assertTrue(default_storage.exists('recipes/old.png'))
+
+    def test_dry_run_and_grace(self):
+        self.assertIn(self.unused, self.collect('--grace=0', '--dry-run'))
+        self.assertIn('Файлов без ссылок: 0', self.collect())
+        self.assertTrue(default_storage.exists(self.unused))
+
+
+class RecipeTransferTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.tags = [
+            Tag.objects.create(name=slug, color='#FFFFFF', slug=slug)
+            for slug in ['breakfast', 'dinner']
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ['соль', 'сахар']
+        ]
+        for index in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'рецепт {index}', image='recipe.png',
+                text='описание', cooking_time=index + 1
+            )
+            recipe.tags.set(cls.tags[:index])
+            for ingredient in cls.ingredients:
+                IngredientToRecipe.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1)
+
+    def snapshot(self):
+        return [
+            (recipe.name, recipe.author_id, recipe.image.name,
+             recipe.cooking_time, recipe.created,
+             sorted(tag.slug for tag in recipe.tags.all()),
+             sorted((item.ingredient_id, item.amount)
+                    for item in recipe.ingredienttorecipe_set.all()))
+            for recipe in Recipe.objects.prefetch_related(
+                'tags', 'ingredienttorecipe_set').order_by('name')
+        ]
+
+    def export(self):
+        out = StringIO()
+        call_command('export_recipes', '--batch-size=2', stdout=out,
+                     stderr=StringIO())
+        return out.getvalue()
+
+    def import_(self, data):
+        out, err = StringIO(), StringIO()
+        with TemporaryDirectory() as directory:
+            path = f'{directory}/recipes.ndjson'
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(data)
+            call_command('import_recipes', path, '--batch-size=2',
+                         stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_round_trip(self):
+        expected = self.snapshot()
+        data = self.export()
+        self.assertEqual(len(data.splitlines()), 3)
+        Recipe.objects.all().delete()
+        out, _ = self.import_(data)
+        self.assertIn('Загружено рецептов: 3, пропущено: 0', out)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+
+    def test_unresolved_references_skipped(self):
+        lines = self.export().splitlines()
+        lines[0] = lines[0].replace('user@example.com', 'nobody@example.com')
+        lines[2] = lines[2].replace('dinner', 'lunch')
+        out, err = self.import_('\n'.join(lines) + '\n')
+        self.assertIn('Загружено рецептов: 1, пропущено: 2', out)
+        self.assertIn('Строка 1: нет пользователя', err)
+        self.assertIn('Строка 3: нет тега lunch', err)
+
+    def test_malformed_line(self):
+        lines = self.export().splitlines()
+        Recipe.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, 'Строка 3'):
+            self.import_('\n'.join(lines[:2]) + '\n{\n')
+        # Первая пачка уже загружена в своей транзакции
+        self.assertEqual(Recipe.objects.count(), 2)
+
+
+class LoadIngredientTest(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, *args):
+        out = StringIO()
+        call_command('load_ingredient', *args, '--batch-size=2', stdout=out)
+        return out.getvalue()
+
+    def test_json_is_idempotent(self):
+        path = self.write('ingredients.json', json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'сахар', 'measurement_unit': 'г'},
+            {'name': 'сахар', 'measurement_unit': 'кг'},
+            {'name': 'соль', 'measurement_unit': 'г'},
+        ], ensure_ascii=False, indent=2))
+        # Маленькие куски проверяют объекты на границе чтения
+        with patch.object(load_ingredient, 'CHUNK_SIZE', 7):
+            self.assertIn('Добавлено: 3, пропущено: 1', self.load(path))
+            self.assertIn('Добавлено: 0, пропущено: 4', self.load(path))
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_csv(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        path = self.write('ingredients.csv',
+                          'name,measurement_unit\nсоль,г\nмука,г\n')
+        self.assertIn('Добавлено: 1, пропущено: 1', self.load(path))
+        self.assertTrue(Ingredient.objects.filter(name='мука').exists())
+
+    def test_invalid_files(self):
+        for name, content in [('broken.json', '[{"name": "соль"'),
+                              ('object.json', '{}'),
+                              ('broken.csv', 'соль\n'),
+                              ('ingredients.xml', '')]:
+            with self.subTest(name=name):
+                with self.assertRaises(CommandError):
+                    self.load(self.write(name, content))
+
+
+@override_settings(AUTH_TOKEN_SHARED_CACHE=True)
+class CachedTokenAuthenticationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_cached(self):
+        # токен с пользователем, подписки
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/users/me/').status_code,
+                             200)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['email'], self.user.email)
+
+    def test_logout(self):
+        self.client.get('/api/users/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_deactivation(self):
+        self.client.get('/api/users/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_password_change(self):
+        self.client.get('/api/users/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', data={
+                'current_password': 'password',
+                'new_password': 'n3w-Passw0rd',
+            })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('n3w-Passw0rd'))
+        with self.assertNumQueries(2):
+            self.client.get('/api/users/me/')
+
+    def test_shared_cache(self):
+        self.client.get('/api/users/me/')
+        token_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/users/me/').status_code,
+                             200)
+
+    def test_revoked_in_other_process(self):
+        self.client.get('/api/users/me/')
+        # Выход обрабатывает другой процесс со своим LRU-кэшем
+        with patch('foodgram_api.authentication.token_cache',
+                   LRUCache(10, 60)), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE=False)
+    def test_disabled_without_shared_cache(self):
+        # Без общего кэша отзыв не дошёл бы до других процессов
+        for _ in range(2):
+            with self.assertNumQueries(2):
+                self.client.get('/api/users/me/')
+
+
+class LoginThrottleTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, email, password='wrong'):
+        return self.client.post('/api/auth/token/login/',
+                                data={'email': email, 'password': password})
+
+    def login_from(self, address, email='user@example.com',
+                   password='wrong'):
+        return self.client.post('/api/auth/token/login/',
+                                data={'email': email, 'password': password},
+                                HTTP_X_FORWARDED_FOR=address)
+
+    @patch.object(LoginEmailThrottle, 'THROTTLE_RATES',
+                  {'login_ip': '100/min', 'login_email': '3/min'})
+    def test_email_limit_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login('User@example.com').status_code, 400)
+        with patch('foodgram_api.views.authenticate') as authenticate, \
+                self.assertLogs('foodgram_api.throttling', 'WARNING'):
+            response = self.login('user@example.com', 'password')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        authenticate.assert_not_called()
+        self.assertEqual(self.login('other@example.com').status_code, 400)
+
+    @patch.object(LoginIPThrottle, 'THROTTLE_RATES',
+                  {'login_ip': '2/min', 'login_email': '100/min'})
+    def test_ip_limit(self):
+        for index in range(2):
+            self.login(f'user{index}@example.com')
+        with self.assertLogs('foodgram_api.throttling', 'WARNING'):
+            response = self.login('user@example.com')
+        self.assertEqual(response.status_code, 429)
+        # Без прокси X-Forwarded-For ставит сам клиент: ему не верим.
+        # Повторные отказы за то же окно в лог не пишутся
+        with patch('foodgram_api.throttling.logger') as logger:
+            self.assertEqual(self.login_from('10.0.0.1').status_code, 429)
+        logger.warning.assert_not_called()
+        self.assertEqual(get_stats()['login_ip']['rejected'], 2)
+
+    @patch.object(LoginIPThrottle, 'THROTTLE_RATES',
+                  {'login_ip': '2/min', 'login_email': '100/min'})
+    @patch.object(api_settings, 'NUM_PROXIES', 1)
+    def test_ip_limit_behind_proxy(self):
+        for index in range(2):
+            self.login_from('10.0.0.1', f'user{index}@example.com')
+        with self.assertLogs('foodgram_api.throttling', 'WARNING'):
+            self.assertEqual(self.login_from('10.0.0.1').status_code, 429)
+        self.assertEqual(
+            self.login_from('10.0.0.2', password='password').status_code, 201)
+
+    def test_list_body(self):
+        response = self.client.post('/api/auth/token/login/', data=[],
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats(self):
+        self.login('user@example.com')
+        admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='password'
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(
+            client.get('/api/auth/throttle_stats/').status_code, 403)
+        client.force_authenticate(admin)
+        response = client.get('/api/auth/throttle_stats/')
+        self.assertEqual(response.data, {
+            'login_ip': {'allowed': 1, 'rejected': 0},
+            'login_email': {'allowed': 1, 'rejected': 0},
+        })
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False)
+class RecipeWriteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.tags = [
+            Tag.objects.create(name=slug, color='#FFFFFF', slug=slug)
+            for slug in ['breakfast', 'dinner']
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(80)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='рецепт', image='recipe.png',
+            text='описание', cooking_time=10
+        )
+        cls.recipe.tags.set(cls.tags[:1])
+        for ingredient in cls.ingredients[:40]:
+            IngredientToRecipe.objects.create(
+                recipe=cls.recipe, ingredient=ingredient, amount=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def test_update_applies_delta(self):
+        link_ids = dict(IngredientToRecipe.objects.filter(
+            recipe=self.recipe).values_list('ingredient_id', 'id'))
+        ingredients = [
+            {'id': ingredient.id, 'amount': 1}
+            for ingredient in self.ingredients[1:]
+        ]
+        ingredients[0]['amount'] = 5
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, data={
+                'name': 'новое название',
+                'cooking_time': 15,
+                'ingredients': ingredients,
+                'tags': [tag.id for tag in self.tags],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        writes = [query['sql'] for query in queries.captured_queries
+                  if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        # рецепт, удаление, изменение и вставка связей, вставка тега
+        self.assertEqual(len(writes), 5, writes)
+        self.assertLessEqual(len(queries), 20)
+        self.recipe.refresh_from_db()
+        self.assertEqual((self.recipe.name, self.recipe.cooking_time),
+                         ('новое название', 15))
+        links = dict(IngredientToRecipe.objects.filter(
+            recipe=self.recipe).values_list('ingredient_id', 'amount'))
+        self.assertEqual(links, {
+            item['id']: item['amount'] for item in ingredients})
+        kept = IngredientToRecipe.objects.filter(
+            recipe=self.recipe, ingredient=self.ingredients[2]).get()
+        self.assertEqual(kept.id, link_ids[self.ingredients[2].id])
+        self.assertEqual(response.data['name'], 'новое название')
+        self.assertEqual(len(response.data['tags']), 2)
+
+        # Замена всего состава рецепта из корзин: число запросов
+        # не зависит ни от числа строк, ни от числа корзин
+        for index in range(3):
+            user = User.objects.create_user(
+                email=f'buyer{index}@example.com', username=f'buyer{index}',
+                password='password'
+            )
+            ShoppingCartItem.objects.create(user=user, recipe=self.recipe)
+        ingredients = [{'id': ingredient.id, 'amount': 2}
+                       for ingredient in self.ingredients[40:]]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                self.url, data={'ingredients': ingredients}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(queries), 20)
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(
+                user__username='buyer0').values_list(
+                    'ingredient_id', 'amount')),
+            {item['id']: 2 for item in ingredients}
+        )
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+
+    def test_update_moves_shopping_lists(self):
+        ShoppingCartItem.objects.create(user=self.user, recipe=self.recipe)
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.client.patch(self.url, data={'ingredients': [
+            {'id': self.ingredients[0].id, 'amount': 3},
+            {'id': self.ingredients[40].id, 'amount': 2},
+        ]}, format='json')
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=self.user).values_list(
+                'ingredient_id', 'amount')),
+            {self.ingredients[0].id: 3, self.ingredients[40].id: 2}
+        )
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+
+    def test_invalid_references(self):
+        ingredient = {'id': self.ingredients[0].id, 'amount': 1}
+        for field, data in [
+            ('ingredients', {'ingredients': [ingredient, ingredient]}),
+            ('ingredients', {'ingredients': [{'id': 0, 'amount': 1}]}),
+            ('ingredients', {'ingredients': [{'id': 10 ** 6,
+                                              'amount': 1}]}),
+            ('ingredients', {'ingredients': []}),
+            ('tags', {'tags': [10 ** 6]}),
+            ('tags', {'tags': []}),
+        ]:
+            with self.subTest(data=data):
+                response = self.client.patch(self.url, data=data,
+                                             format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.data)
+
+    def test_create_requires_relations(self):
+        response = self.client.post('/api/recipes/', data={
+            'image': make_image_base64((10, 10)),
+            'name': 'рецепт', 'text': 'описание', 'cooking_time': 1,
+            'tags': [self.tags[0].id],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.data)
+
+
+class BenchmarkEndpointsTest(TestCase):
+    def test_seed_and_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_endpoints', '--seed=5', '--repeat=1',
+                     stdout=out)
+        self.assertIn('Добавлено пользователей: 5, рецептов: 50',
+                      out.getvalue())
+        self.assertIn('/api/recipes/?is_favorited=1', out.getvalue())
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+
+    def test_results_saved_and_compared(self):
+        call_command('seed_data', '--users=3', '--recipes-per-user=2',
+                     '--favorites-per-user=0', '--cart-per-user=0',
+                     '--subscriptions-per-user=0', stdout=StringIO())
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/baseline.json'
+        call_command('benchmark_endpoints', '--repeat=2', f'--output={path}',
+                     stdout=StringIO())
+        with open(path, encoding='utf-8') as file:
+            saved = json.load(file)
+        self.assertEqual(saved['meta']['recipes'], 6)
+        result = saved['results']['GET /api/recipes/']
+        self.assertLessEqual(result['p50'], result['p99'])
+        self.assertGreater(result['size'], 0)
+        self.assertGreater(result['queries'], 0)
+        # Записи откатываются парными запросами
+        for action in ['/favorite/', '/shopping_cart/', '/subscribe/']:
+            self.assertEqual(
+                [name.split()[0] for name in saved['results']
+                 if name.endswith(action)],
+                ['POST', 'DELETE']
+            )
+        call_command('reconcile_counters', '--check', stdout=StringIO())
+        result['queries'] -= 1
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(saved, file)
+        # Порог по времени заведомо большой: одиночный замер может
+        # попасть на сборку мусора, проверяем только число запросов
+        with self.assertRaisesMessage(CommandError, 'регрессий: 1'):
+            call_command('benchmark_endpoints', '--repeat=1',
+                         f'--compare={path}', '--threshold=1000000',
+                         stdout=StringIO(), stderr=StringIO())
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False)
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='password'
+        )
+        cls.tag = Tag.objects.create(name='обед', color='#FFFFFF',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', data={
+                'image': make_image_base64((10, 10)),
+                'name': 'рецепт', 'text': 'описание', 'cooking_time': 1,
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def test_recipe_counters(self):
+        recipe = self.create_recipe()
+        for action in ['favorite', 'shopping_cart']:
+            self.client.post(f'/api/recipes/{recipe.id}/{action}/')
+            self.client.post(f'/api/recipes/{recipe.id}/{action}/')
+        recipe.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual((recipe.favorites_count, recipe.carts_count),
+                         (1, 1))
+        self.assertEqual(self.user.recipes_count, 1)
+        for action in ['favorite', 'shopping_cart']:
+            self.client.delete(f'/api/recipes/{recipe.id}/{action}/')
+            self.client.delete(f'/api/recipes/{recipe.id}/{action}/')
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.favorites_count, recipe.carts_count),
+                         (0, 0))
+        self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 0)
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+
+    def test_subscribers_count(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        self.client.post(url)
+        self.client.post(url)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 1)
+        self.client.delete(url)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+
+    def test_model_changes(self):
+        # Админка и ORM меняют счётчики так же, как API
+        recipe = Recipe.objects.create(
+            author=self.author, name='рецепт', image='recipe.png',
+            text='описание', cooking_time=10
+        )
+        favorite = Favorites.objects.create(user=self.user, recipe=recipe)
+        ShoppingCartItem.objects.create(user=self.user, recipe=recipe)
+        Subscription.objects.create(user=self.author, subscriber=self.user)
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual((recipe.favorites_count, recipe.carts_count),
+                         (1, 1))
+        self.assertEqual(
+            (self.author.recipes_count, self.author.subscribers_count),
+            (1, 1))
+
+        recipe.author = self.user
+        recipe.save(update_fields=['author'])
+        other = Recipe.objects.create(
+            author=self.author, name='другой', image='recipe.png',
+            text='описание', cooking_time=10
+        )
+        favorite.recipe = other
+        favorite.save()
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+
+        # Каскад: подписки и корзина удалённого пользователя
+        self.user.delete()
+        self.author.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.author.subscribers_count, 0)
+        self.assertEqual(other.favorites_count, 0)
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+
+    def test_reconcile(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='рецепт', image='recipe.png',
+            text='описание', cooking_time=10
+        )
+        Favorites.objects.create(user=self.user, recipe=recipe)
+        # Как после bulk_create, который не отправляет сигналы
+        Recipe.objects.update(favorites_count=0)
+        User.objects.update(recipes_count=0)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', '--check', stdout=StringIO())
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('Исправлено расхождений: 2', out.getvalue())
+        call_command('reconcile_counters', '--check', stdout=StringIO())
+        recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(self.author.recipes_count, 1)
+
+
+class RecipeAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='password'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                email=f'author{index}@example.com',
+                username=f'author{index:02}', password='password')
+            for index in range(25)
+        ]
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(500)
+        ])
+        ingredients = list(Ingredient.objects.order_by('id')[:30])
+        for author in cls.authors:
+            recipe = Recipe.objects.create(
+                author=author, name='рецепт', image='recipe.png',
+                text='описание', cooking_time=10
+            )
+        IngredientToRecipe.objects.bulk_create([
+            IngredientToRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=1)
+            for ingredient in ingredients
+        ])
+        cls.recipe = recipe
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_change_page_does_not_embed_catalog(self):
+        response = self.client.get(
+            f'/admin/foodgram_api/recipe/{self.recipe.id}/change/')
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('ингредиент 29<', content)
+        self.assertNotIn('ингредиент 499<', content)
+        self.assertLess(len(response.content), 200 * 1024)
+
+    def test_change_page_query_count(self):
+        url = f'/admin/foodgram_api/recipe/{self.recipe.id}/change/'
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        IngredientToRecipe.objects.bulk_create([
+            IngredientToRecipe(recipe=self.recipe, ingredient=ingredient,
+                               amount=1)
+            for ingredient in Ingredient.objects.order_by('id')[30:60]
+        ])
+        # Число запросов не растёт со строками инлайна
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertContains(response, 'ингредиент 59<')
+
+    def test_changelist(self):
+        url = '/admin/foodgram_api/recipe/'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + '?o=3')
+        self.assertEqual(response.status_code, 200)
+        # Авторы подгружаются одним запросом, без запроса на строку
+        self.assertLess(len(queries), 15)
+        # title есть только у ссылок фильтра, не у ячеек списка
+        last_choice = f'title="{self.authors[-1].email}"'
+        self.assertContains(response, 'следующие →')
+        self.assertNotContains(response, last_choice)
+        response = self.client.get(url + '?author_page=2')
+        self.assertContains(response, last_choice)
+        self.assertContains(response, '← предыдущие')
+        response = self.client.get(
+            f'{url}?author__id__exact={self.authors[-1].id}')
+        self.assertContains(response, '1 рецепт')
+
+
+class RequestTimingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            password='password'
+        )
+        for index in range(3):
+            Recipe.objects.create(
+                author=author, name=f'рецепт {index}', image='recipe.png',
+                text='описание', cooking_time=10
+            )
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/recipes/')
+        metrics = {
+            item.split(';')[0]: item
+            for item in response['Server-Timing'].split(', ')
+        }
+        self.assertEqual(list(metrics), ['db', 'view', 'render', 'total'])
+        self.assertRegex(metrics['db'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries"$')
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_logged(self):
+        with self.assertLogs('foodgram_api.instrumentation',
+                             'WARNING') as logs:
+            self.client.get('/api/recipes/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['event'], 'slow_request')
+        self.assertEqual(record['url_name'], 'recipe-list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertGreaterEqual(record['total'], record['view'])
+        for query in record['repeated_queries']:
+            self.assertGreater(query['count'], 1)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=500)
+    def test_fast_request_not_logged(self):
+        with patch('foodgram_api.instrumentation.logger') as logger:
+            self.client.get('/api/tags/')
+        logger.warning.assert_not_called()
+
+
+class ProfilingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            email='staff@example.com', username='staff',
+            password='password', is_staff=True
+        )
+        cls.user = User.objects.create_user(
+            email='user@example.com', username='user', password='password'
+        )
+
+    def setUp(self):
+        profile_dir = TemporaryDirectory()
+        self.addCleanup(profile_dir.cleanup)
+        profile_settings = override_settings(
+            REQUEST_PROFILING=True, PROFILE_DIR=profile_dir.name)
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+        self.profile_dir = profile_dir.name
+        self.client = APIClient()
+
+    def get(self, user, **extra):
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return self.client.get('/api/users/subscriptions/', **extra)
+
+    def test_staff_request_profiled(self):
+        response = self.get(self.staff, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile']
+        self.assertTrue(name.startswith(
+            'foodgram_api.views.SubscriptionListAPIView-'))
+        out = StringIO()
+        call_command('profiles', stdout=out)
+        self.assertIn(name, out.getvalue())
+        out = StringIO()
+        call_command('profiles', 'foodgram_api.views.Subscription',
+                     '--limit=5', stdout=out)
+        self.assertIn('function calls', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('profiles', 'нет такого', stdout=StringIO())
+
+    def test_query_flag(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/tags/?profile=1')
+        self.assertTrue(response['X-Profile'].endswith('.prof'))
+
+    @override_settings(PROFILE_MAX_FILES=2)
+    def test_old_profiles_removed(self):
+        self.client.force_login(self.staff)
+        names = [
+            self.client.get('/api/tags/?profile=1')['X-Profile']
+            for _ in range(3)
+        ]
+        self.assertCountEqual(os.listdir(self.profile_dir), names[1:])
+
+    def test_not_profiled(self):
+        with patch('foodgram_api.profiling.cProfile.Profile') as profile:
+            response = self.get(self.user, HTTP_X_PROFILE='1')
+            self.assertEqual(response.status_code, 200)
+            response = self.get(self.staff)
+        profile.assert_not_called()
+        self.assertNotIn('X-Profile', response)
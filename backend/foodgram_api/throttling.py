@@ -0,0 +1,88 @@
+import hashlib
+import logging
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'throttle-stats:{scope}:{result}'
+
+
+class AuthRateThrottle(SimpleRateThrottle):
+    """Скользящее окно попыток входа в кэше LOGIN_THROTTLE_CACHE.
+
+    Троттлинг проверяется до вызова view, то есть до хэширования пароля.
+    Число пропущенных и отклонённых запросов копится в том же кэше,
+    см. get_stats. В лог пишется только первый отказ для ключа
+    за окно: при подборе паролей отказов столько же, сколько попыток.
+    """
+    cache = caches[settings.LOGIN_THROTTLE_CACHE]
+
+    def allow_request(self, request, view):
+        allowed = super().allow_request(request, view)
+        if getattr(self, 'key', None) is not None:
+            count(self.scope, 'allowed' if allowed else 'rejected')
+            if not allowed and self.cache.add(
+                    f'{self.key}:tripped', 1, timeout=self.duration):
+                logger.warning('Троттлинг %s: слишком много попыток',
+                               self.scope)
+        return allowed
+
+
+class LoginIPThrottle(AuthRateThrottle):
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
+
+
+class LoginEmailThrottle(AuthRateThrottle):
+    """Попытки для одного email, с любых адресов."""
+    scope = 'login_email'
+
+    def get_cache_key(self, request, view):
+        if request.user.is_authenticated:
+            email = request.user.email
+        elif isinstance(request.data, Mapping):
+            email = request.data.get('email')
+        else:
+            # Тело — список или скаляр JSON: email в нём нет
+            return None
+        if not isinstance(email, str) or not email:
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': hashlib.sha256(
+                email.strip().lower().encode()).hexdigest(),
+        }
+
+
+def count(scope, result):
+    key = STATS_KEY.format(scope=scope, result=result)
+    cache = AuthRateThrottle.cache
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ успел вытесниться между add и incr
+        cache.set(key, 1, timeout=None)
+
+
+def get_stats():
+    """Счётчики троттлинга: {scope: {'allowed': n, 'rejected': n}}."""
+    scopes = [LoginIPThrottle.scope, LoginEmailThrottle.scope]
+    keys = {
+        STATS_KEY.format(scope=scope, result=result): (scope, result)
+        for scope in scopes for result in ['allowed', 'rejected']
+    }
+    values = AuthRateThrottle.cache.get_many(keys)
+    stats = {scope: {'allowed': 0, 'rejected': 0} for scope in scopes}
+    for key, (scope, result) in keys.items():
+        stats[scope][result] = values.get(key, 0)
+    return stats
@@ -1,5 +1,11 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Case, Count, Exists, Max, OuterRef, Subquery, \
+    Sum, Value, When
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, mixins, generics, permissions
@@ -9,15 +15,23 @@ from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_201_CREATED, \
     HTTP_204_NO_CONTENT
 from rest_framework.views import APIView
 
+from .catalog import INGREDIENTS, TAGS, get_catalog_versions, \
+    get_ingredient_index
+from .counters import delete_once
 from .filters import RecipeFilter
-from .mixins import CreateDestroyMixin
+from .mixins import CatalogCacheMixin, ConditionalGetMixin, \
+    CreateDestroyMixin
 from .models import User, Tag, Ingredient, Recipe, Favorites, Subscription, \
     ShoppingCartItem
+from .pagination import RecipePagination
+from .renderers import SHOPPING_CART_RENDERERS, FormatQueryParamNegotiation, \
+    get_shopping_cart_renderers
 from .serializers import UserSerializer, PasswordChangeSerializer, \
     TagSerializer, IngredientSerializer, RecipeSerializer, \
     RecipeCreateUpdateSerializer, SubscriptionSerializer, \
-    ShoppingCartSerializer
-from .shopping_cart import create_shopping_cart_list
+    ShoppingCartSerializer, get_recipes_limit
+from .shopping_cart import iter_shopping_cart_list
+from .throttling import LoginEmailThrottle, LoginIPThrottle, get_stats
 
 
 class UserViewset(mixins.ListModelMixin, mixins.RetrieveModelMixin,
@@ -42,6 +56,8 @@ class CurrentUserRetrieveAPIView(generics.RetrieveAPIView):
 
 
 class TokenCreateAPIView(APIView):
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
+
     def post(self, request, *args, **kwargs):
         if {'email', 'password'}.issubset(request.data):
             user = authenticate(
@@ -81,33 +97,144 @@ class TokenDestroyAPIView(generics.GenericAPIView):
 class PasswordChangeAPIView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = PasswordChangeSerializer
+    throttle_classes = [LoginIPThrottle, LoginEmailThrottle]
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
+            user = request.user
+            user.set_password(serializer.validated_data['new_password'])
+            # Сохранение пользователя сбрасывает кэш его токенов
+            user.save(update_fields=['password'])
             return Response(status=HTTP_204_NO_CONTENT)
         return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
 
 
-class TagViewset(mixins.ListModelMixin, mixins.RetrieveModelMixin,
-                 viewsets.GenericViewSet):
+class ThrottleStatsAPIView(APIView):
+    """Счётчики троттлинга входа для администраторов."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class TagViewset(CatalogCacheMixin, mixins.ListModelMixin,
+                 mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    catalog_name = TAGS
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewset(mixins.ListModelMixin, mixins.RetrieveModelMixin,
-                        viewsets.GenericViewSet):
+class IngredientViewset(CatalogCacheMixin, mixins.ListModelMixin,
+                        mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    catalog_name = INGREDIENTS
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
 
-
-class RecipeViewset(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(None, lambda: self.search(name))
+
+    def search(self, name):
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        if settings.INGREDIENT_SEARCH_INDEX:
+            return Response(get_ingredient_index().search(name, limit))
+        queryset = self.get_queryset().filter(
+            name__icontains=name
+        ).annotate(
+            is_prefix=Case(When(name__istartswith=name, then=Value(0)),
+                           default=Value(1))
+        ).order_by('is_prefix', 'name')[:limit]
+        return Response(self.get_serializer(queryset, many=True).data)
+
+
+class RecipeViewset(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+
+    def get_queryset(self):
+        if self.action in ('update', 'partial_update', 'destroy'):
+            # Связи здесь не выводятся: ответ на изменение собирает
+            # RecipeCreateUpdateSerializer.to_representation
+            return Recipe.objects.all()
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user).order_by('-created', '-id')
+
+    def get_catalog_versions(self):
+        return get_catalog_versions(TAGS, INGREDIENTS)
+
+    def get_viewer_state(self):
+        """Число и максимальный id избранного, корзины и подписок.
+
+        Эти таблицы только пополняются и удаляются, поэтому любое
+        изменение меняет хотя бы одно из значений.
+        """
+        user = self.request.user
+        if user.is_anonymous:
+            return None
+        aggregates = {}
+        for name, model, field in [
+            ('favorites', Favorites, 'user'),
+            ('cart', ShoppingCartItem, 'user'),
+            ('subscriptions', Subscription, 'subscriber'),
+        ]:
+            rows = model.objects.filter(
+                **{field: OuterRef('pk')}).order_by().values(field)
+            aggregates[f'{name}_count'] = Subquery(
+                rows.annotate(value=Count('id')).values('value'))
+            aggregates[f'{name}_max_id'] = Subquery(
+                rows.annotate(value=Max('id')).values('value'))
+        return User.objects.filter(pk=user.pk).annotate(
+            **aggregates).values_list(*aggregates).get()
+
+    def get_list_validators(self):
+        # Страница ?page= выводит count всей выборки, и валидатор для неё
+        # стоил бы ещё одного прохода по всей выборке. Условный ответ
+        # только у курсора: агрегат читает лишь строки его страницы
+        if not self.paginator.is_cursor_mode(self.request):
+            return None
+        queryset = self.paginator.limit_queryset(
+            self.filter_queryset(Recipe.objects.all()), self.request)
+        # Рецепты страницы и профили их авторов, которые выводятся рядом
+        state = queryset.aggregate(count=Count('id'), ids=Sum('id'),
+                                   last_modified=Max('updated'),
+                                   authors_modified=Max('author__updated'))
+        return (
+            (*state.values(), self.get_viewer_state(),
+             *self.get_catalog_versions()),
+            None
+        )
+
+    def get_detail_validators(self):
+        try:
+            pk = int(self.kwargs[self.lookup_field])
+        except ValueError:
+            # 404 вернёт обычный get_object
+            return None
+        user = self.request.user
+        queryset = Recipe.objects.with_user_flags(user).filter(pk=pk)
+        fields = ['updated', 'author__updated', 'is_favorited',
+                  'is_in_shopping_cart']
+        if user.is_authenticated:
+            queryset = queryset.annotate(author_is_subscribed=Exists(
+                Subscription.objects.filter(user=OuterRef('author'),
+                                            subscriber=user)
+            ))
+            fields.append('author_is_subscribed')
+        state = queryset.values_list(*fields).first()
+        if state is None:
+            return None
+        # Отметки пользователя не меняют дату рецепта, поэтому
+        # Last-Modified отдаётся только анонимам
+        last_modified = max(state[:2]) if user.is_anonymous else None
+        return (*state, *self.get_catalog_versions()), last_modified
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -117,6 +244,10 @@ class RecipeViewset(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        delete_once(instance)
+
 
 class FavoritesCreateDestroyAPIView(CreateDestroyMixin,
                                     generics.GenericAPIView):
@@ -139,8 +270,6 @@ class FavoritesCreateDestroyAPIView(CreateDestroyMixin,
 
     def create(self, request, *args, **kwargs):
         recipe = self.get_recipe()
-        print(recipe)
-        print(self.request.user)
         favorite, created = Favorites.objects.get_or_create(
             recipe=recipe,
             user=self.request.user
@@ -158,10 +287,24 @@ class FavoritesCreateDestroyAPIView(CreateDestroyMixin,
 class SubscriptionListAPIView(generics.ListAPIView):
     serializer_class = SubscriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
-    permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Subscription.objects.filter(subscriber=self.request.user)
+        return Subscription.objects.filter(
+            subscriber=self.request.user
+        ).select_related('user').order_by('id')
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is None:
+            return page
+        recipes = defaultdict(list)
+        for recipe in Recipe.objects.latest_for_authors(
+                [subscription.user_id for subscription in page],
+                get_recipes_limit(self.request)):
+            recipes[recipe.author_id].append(recipe)
+        for subscription in page:
+            subscription.latest_recipes = recipes[subscription.user_id]
+        return page
 
 
 class SubscriptionCreateDestroyAPIView(CreateDestroyMixin,
@@ -221,6 +364,7 @@ class ShoppingCartCreateDestroyAPIView(CreateDestroyMixin,
         except queryset.model.DoesNotExist:
             return None
 
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
         recipe = self.get_recipe()
         item, created = ShoppingCartItem.objects.get_or_create(
@@ -238,12 +382,23 @@ class ShoppingCartCreateDestroyAPIView(CreateDestroyMixin,
 
 class ShoppingCartDownloadAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = SHOPPING_CART_RENDERERS
+    content_negotiation_class = FormatQueryParamNegotiation
 
-    def get(self, request, *args, **kwargs):
-        data = create_shopping_cart_list(self.request.user)
+    def get_renderers(self):
+        # ?format=pdf без рабочего шрифта получает 404 до начала потока
+        return [renderer() for renderer in get_shopping_cart_renderers()]
 
-        response = HttpResponse(data, content_type='text/plain')
-        file_name = f'{self.request.user.username}.txt'
+    def get(self, request, *args, **kwargs):
+        renderer = self.request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            iter_shopping_cart_list(self.request.user, renderer.format),
+            content_type=content_type
+        )
+        file_name = f'{self.request.user.username}.{renderer.format}'
         response[
-            'Content-Disposition'] = f'attachment; file_name="{file_name}"'
+            'Content-Disposition'] = f'attachment; filename="{file_name}"'
         return response